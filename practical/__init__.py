@@ -13,22 +13,41 @@ from __future__ import division, print_function, absolute_import
 
 from practical.arrays import (
     convert_dict_to_array,
+    convert_dicts_to_array,
+    stream_dicts_to_array,
+    KeySchema,
+    convert_dict_to_sparse,
+    convert_dicts_to_sparse,
+    SparseBatch,
     reshape,
     reshape_into_matrix,
     reshape_into_vector)
 from practical.memory import (
-    memoize)
+    memoize,
+    memoize_method,
+    parallel_map,
+    register_key_builder,
+    set_memoize_budget,
+    SharedCacheServer,
+    connect_shared_cache)
 from practical.types import (
     typecheck,
+    set_typecheck_mode,
+    get_typecheck_mode,
+    set_typecheck_instrumentation,
+    typecheck_snapshot,
+    typecheck_report,
     anything,
     one_of,
+    cached,
     iterable,
     numeric,
     finite,
     symbolic,
     bounds,
     specifications,
-    trace_data)
+    trace_data,
+    Trace)
 from practical.units import (
     convert_radian_to_degree,
     convert_degree_to_radian)
@@ -41,24 +60,43 @@ __version__ = '0.4.8'
 
 __all__ = [
     'convert_dict_to_array',
+    'convert_dicts_to_array',
+    'stream_dicts_to_array',
+    'KeySchema',
+    'convert_dict_to_sparse',
+    'convert_dicts_to_sparse',
+    'SparseBatch',
     'reshape',
     'reshape_into_matrix',
     'reshape_into_vector']
 
 __all__ += [
-    'memoize']
+    'memoize',
+    'memoize_method',
+    'parallel_map',
+    'register_key_builder',
+    'set_memoize_budget',
+    'SharedCacheServer',
+    'connect_shared_cache']
 
 __all__ += [
     'typecheck',
+    'set_typecheck_mode',
+    'get_typecheck_mode',
+    'set_typecheck_instrumentation',
+    'typecheck_snapshot',
+    'typecheck_report',
     'anything',
     'one_of',
+    'cached',
     'iterable',
     'numeric',
     'finite',
     'symbolic',
     'bounds',
     'specifications',
-    'trace_data']
+    'trace_data',
+    'Trace']
 
 __all__ += [
     'convert_radian_to_degree',
@@ -9,7 +9,9 @@ Matrices & vector handling
 
 from __future__ import division, print_function, absolute_import
 
-from decorator import decorator
+import functools
+import inspect
+import itertools
 import numpy as np
 
 from practical.types import (
@@ -24,102 +26,450 @@ from practical.types import (
 # SHAPE ENFORCING
 #####################################################################
 
-@typecheck
-def _reshape(
-        arg: anything,
-        shape: tuple) -> anything:
+def _reshaper(shape):
     """
-    Reshapes any object.
-    Checks whether the object is an array and the shape is valid.
+    Compiles a target shape into the function reshaping the arrays.
 
     Parameters
     ----------
-    x:
-        Anything.
     shape: tuple.
-        A tuple of integers ; can ba empty.
+        A tuple of integers ; can be empty.
 
     Returns
     -------
-    out:
-        Anything, but reshaped if the conditions are met.
+    out: callable.
+        Reshapes the arrays which don't have the target shape already, and
+        returns the other objects as they are. None for the empty shapes,
+        which leave the objects untouched.
     """
-    if shape and isinstance(arg, np.ndarray):
-        return np.reshape(
-            a=arg,
-            newshape=shape)
+    if not shape:
+        return None
+
+    shape = tuple(shape)
+
+    if -1 in shape:     # the actual shape can't be predicted
+        def __reshape(arg):
+            if isinstance(arg, np.ndarray):
+                return np.reshape(arg, shape)
+            return arg
     else:
-        return arg
+        def __reshape(arg):
+            if isinstance(arg, np.ndarray) and arg.shape != shape:
+                return np.reshape(arg, shape)
+            return arg
+
+    return __reshape
 
 @typecheck
 def reshape(
-        *shapes) -> callable:
+        *shapes,
+        **keyword_shapes) -> callable:
     """
-    Function decorator. Check whether the ndarray arguments match the
-    required shapes.
+    Function decorator. Reshapes the ndarray arguments of the decorated
+    function, and optionally its return value.
+
+    The shapes are matched with the parameters once and for all, at
+    decoration time ; the arguments are reshaped whether they are passed
+    by position or by keyword. The arguments which are not arrays, or
+    have the required shape already, are passed as they are.
 
     Parameters
     ----------
     shapes: list of tuples.
-        The expected shapes for each ndarray argument.
-        For non array types, provide an empty tuple.
+        The expected shapes for the positional parameters, in order.
+        For non array types, provide an empty tuple. An extra shape
+        applies to the return value.
+    keyword_shapes: dict of tuples.
+        The expected shapes of other parameters, by name ; keyword only
+        parameters included.
 
     Returns
     -------
-    out: caller function, decorated.
-        All the ndarray arguments are reshaped.
-    """
-    def caller(f, *args, **kwargs):
-        assert (
-            len(args) == len(shapes)
-            or len(args) + 1 == len(shapes))
-
-        reshaped_args = [
-            _reshape(arg=arg, shape=shapes[i])
-            for i, arg in enumerate(args)]
-
-        if len(shapes) == len(args) + 1:     # shape the return value
-            return _reshape(
-                arg=f(*reshaped_args, **kwargs),
-                shape=shapes[-1])
-        else:
-            return f(*reshaped_args, **kwargs)
+    out: callable.
+        The decorator ; all the ndarray arguments of the function it
+        decorates are reshaped.
+    """
+    def __decorate(func):
+        __parameters = inspect.signature(func).parameters
+        __positional = [
+            __name for __name, __parameter in __parameters.items()
+            if __parameter.kind in (
+                inspect.Parameter.POSITIONAL_ONLY,
+                inspect.Parameter.POSITIONAL_OR_KEYWORD)]
+
+        if len(shapes) > len(__positional) + 1:
+            raise ValueError(
+                "{}() takes {} positional arguments, but {} shapes were "
+                "given".format(func.__name__, len(__positional), len(shapes)))
+
+        __unknown = set(keyword_shapes) - set(__parameters)
+        if __unknown:
+            raise ValueError("{}() has no parameter {}".format(
+                func.__name__,
+                ', '.join(sorted(__unknown))))
+
+        __shapes = dict(zip(__positional, shapes))
+        __shapes.update(keyword_shapes)
+
+        # (index, name, reshaper) ; the index is None for keyword only
+        __slots = []
+        for __name, __shape in __shapes.items():
+            __reshape = _reshaper(__shape)
+            if __reshape is not None:
+                __slots.append((
+                    __positional.index(__name)
+                    if __name in __positional else None,
+                    __name,
+                    __reshape))
+        __slots = tuple(__slots)
+
+        __returns = None
+        if len(shapes) == len(__positional) + 1:
+            __returns = _reshaper(shapes[-1])
+
+        if not (__slots or __returns):
+            return func
+
+        @functools.wraps(func)
+        def __reshaped(*args, **kwargs):
+            if __slots:
+                __count = len(args)
+                for __i, __name, __reshape in __slots:
+                    if __i is not None and __i < __count:
+                        __arg = __reshape(args[__i])
+                        if __arg is not args[__i]:
+                            args = args[:__i] + (__arg,) + args[__i + 1:]
+                    elif __name in kwargs:
+                        kwargs[__name] = __reshape(kwargs[__name])
+
+            if __returns is None:
+                return func(*args, **kwargs)
+            return __returns(func(*args, **kwargs))
 
-    return decorator(caller)
+        return __reshaped
+
+    return __decorate
 
 #####################################################################
 # LINEAR ALGEBRA & ARRAY MANIPULATIONS
 #####################################################################
 
+# number of values converted at a time, when filling an output buffer
+_DICT_CHUNK_SIZE = 1024
+
 @typecheck
 def convert_dict_to_array(
         data: dict,
         keys: one_of(nothing, iterable) = None,
-        default: numeric = 0.0) -> np.ndarray:
+        default: numeric = 0.0,
+        dtype: anything = None,
+        out: one_of(nothing, np.ndarray) = None) -> np.ndarray:
     """
     Creates an array with the size of keys, filling missing dimensions.
 
+    With an explicit dtype, or an output buffer, the values are written
+    by np.fromiter without an intermediate list, and without inferring
+    the type : values which don't fit the dtype raise an error, instead
+    of producing an object array. The output buffer is filled in place,
+    in bounded chunks.
+
     Parameters
     ----------
     data: dict.
         The dictionary to convert.
-    keys: list of string
-        The FULL list of axes keys.
+    keys: list of string or KeySchema.
+        The FULL list of axes keys ; a schema has its own defaults, and
+        fills the output buffer in place.
+    default: numeric.
+        The value of the missing keys.
+    dtype: np.dtype.
+        The type of the values ; inferred from them when None, unless
+        there is an output buffer.
+    out: np.ndarray.
+        The 1-D buffer to fill and return, with the size of keys ; can be
+        reused from one call to the next.
 
     Returns
     -------
     out: np.array.
         The array, with the size of keys.
     """
+    if isinstance(keys, KeySchema):
+        return keys.to_array(data, dtype=dtype, out=out)
+
     axes = keys if keys else data.keys()
 
-    data_list = [
-        data.get(a, default) 
-        for a in axes]
+    if dtype is None and out is None:
+        data_list = [
+            data.get(a, default)
+            for a in axes]
+
+        return np.array(data_list)
+
+    if out is None:
+        return np.fromiter(
+            map(data.get, axes, itertools.repeat(default)),
+            dtype=dtype,
+            count=len(axes) if hasattr(axes, '__len__') else -1)
+
+    if not hasattr(axes, '__len__'):
+        axes = list(axes)
+
+    if out.shape != (len(axes),):
+        raise ValueError(
+            "expected an output buffer of shape {}, got {}".format(
+                (len(axes),),
+                out.shape))
+
+    # written in place, a chunk at a time : the temporary arrays are
+    # bounded, whatever the number of keys
+    __values = map(data.get, axes, itertools.repeat(default))
+    for __start in range(0, len(out), _DICT_CHUNK_SIZE):
+        __chunk = out[__start:__start + _DICT_CHUNK_SIZE]
+        __chunk[...] = np.fromiter(
+            __values,
+            dtype=out.dtype,
+            count=len(__chunk))
+    return out
+
+# number of rows filled at a time, when the number of records is unknown
+_DICT_BLOCK_SIZE = 4096
+
+def _key_columns(keys):
+    """
+    Resolves the columns of the keys, once for a batch of records.
+
+    Parameters
+    ----------
+    keys: iterable.
+        The FULL list of axes keys ; the keys can be repeated.
+
+    Returns
+    -------
+    out: tuple.
+        - the number of columns.
+        - a dict mapping each key to its first column.
+        - the (targets, sources) columns of the repeated keys, copied
+          from their first column ; None if there are none.
+    """
+    __keys = list(keys)
+    __columns = {}
+    __targets = []
+    __sources = []
+    for __j, __key in enumerate(__keys):
+        if __key in __columns:
+            __targets.append(__j)
+            __sources.append(__columns[__key])
+        else:
+            __columns[__key] = __j
+
+    __duplicates = None
+    if __targets:
+        __duplicates = (np.array(__targets), np.array(__sources))
+
+    return len(__keys), __columns, __duplicates
+
+def _key_layout(keys, default, dtype):
+    """
+    Resolves the layout of the rows, unless it is compiled in a schema.
+
+    Parameters
+    ----------
+    keys: iterable or KeySchema.
+        The FULL list of axes keys.
+    default: numeric.
+        The value of the missing keys ; ignored for a schema.
+    dtype: np.dtype.
+        The type of the values ; float64 by default, or the type of the
+        schema.
+
+    Returns
+    -------
+    out: tuple.
+        The number of columns, the column of each key, the repeated
+        columns (see _key_columns), the default values and the dtype.
+    """
+    if isinstance(keys, KeySchema):
+        __width, __columns, __duplicates, __defaults, __dtype = keys._layout
+        return (
+            __width,
+            __columns,
+            __duplicates,
+            __defaults,
+            __dtype if dtype is None else dtype)
+
+    __width, __columns, __duplicates = _key_columns(keys)
+    return (
+        __width,
+        __columns,
+        __duplicates,
+        default,
+        np.float64 if dtype is None else dtype)
+
+def _fill_rows(block, records, columns, duplicates, defaults):
+    """
+    Fills the rows of a block with records, in order.
+
+    Parameters
+    ----------
+    block: np.ndarray.
+        The 2-D array to fill.
+    records: iterator.
+        The dicts ; at most one per row is consumed.
+    columns: dict.
+        The column of each key.
+    duplicates: tuple.
+        The (targets, sources) columns of the repeated keys.
+    defaults: numeric or np.ndarray.
+        The value of the missing keys, or the row of the default values.
+
+    Returns
+    -------
+    out: int.
+        The number of rows filled.
+    """
+    block[...] = defaults
+    __count = 0
+    for __row, __record in zip(block, records):
+        for __key, __value in __record.items():
+            __j = columns.get(__key, None)
+            if __j is not None:
+                __row[__j] = __value
+        __count += 1
+
+    if duplicates is not None and __count:
+        __targets, __sources = duplicates
+        block[:__count, __targets] = block[:__count, __sources]
+
+    return __count
+
+@typecheck
+def convert_dicts_to_array(
+        records: iterable,
+        keys: iterable,
+        default: numeric = 0.0,
+        dtype: anything = None) -> np.ndarray:
+    """
+    Creates a matrix from a batch of dicts, with a row per dict and a
+    column per key, filling the missing values.
+
+    The columns of the keys are resolved once for the whole batch, and
+    the rows are filled in place : the matrix is preallocated when the
+    number of records is known, and grown by blocks otherwise.
+
+    Parameters
+    ----------
+    records: iterable of dicts.
+        The dictionaries to convert.
+    keys: list of string or KeySchema.
+        The FULL list of axes keys.
+    default: numeric.
+        The value of the missing keys ; a schema has its own defaults.
+    dtype: np.dtype.
+        The type of the values ; float64 by default, or the type of the
+        schema.
+
+    Returns
+    -------
+    out: np.ndarray.
+        The matrix, of shape (number of records, number of keys).
+    """
+    __width, __columns, __duplicates, __defaults, __dtype = _key_layout(
+        keys,
+        default,
+        dtype)
+
+    try:
+        __height = len(records)
+    except TypeError:
+        # the layout is resolved already, and keys may be an iterator
+        __blocks = list(_row_blocks(
+            iter(records),
+            (__width, __columns, __duplicates, __defaults, __dtype),
+            _DICT_BLOCK_SIZE))
+        if not __blocks:
+            return np.empty((0, __width), dtype=__dtype)
+        return np.concatenate(__blocks) if len(__blocks) > 1 else __blocks[0]
+
+    __matrix = np.empty((__height, __width), dtype=__dtype)
+    _fill_rows(__matrix, iter(records), __columns, __duplicates, __defaults)
+
+    return __matrix
+
+@typecheck
+def stream_dicts_to_array(
+        records: iterable,
+        keys: iterable,
+        blocksize: int = _DICT_BLOCK_SIZE,
+        default: numeric = 0.0,
+        dtype: anything = None) -> iterable:
+    """
+    Converts a stream of dicts into matrices of fixed size, with a row per
+    dict and a column per key ; the memory is bounded by the block size.
+
+    The records are consumed lazily, a block at a time.
+
+    Parameters
+    ----------
+    records: iterable of dicts.
+        The dictionaries to convert.
+    keys: list of string or KeySchema.
+        The FULL list of axes keys.
+    blocksize: int.
+        The number of rows of the blocks, at least 1.
+    default: numeric.
+        The value of the missing keys ; a schema has its own defaults.
+    dtype: np.dtype.
+        The type of the values ; float64 by default, or the type of the
+        schema.
+
+    Returns
+    -------
+    out: generator.
+        The blocks, of shape (blocksize, number of keys) ; the last one
+        has the remaining rows.
+    """
+    if blocksize < 1:
+        raise ValueError(
+            "the block size must be positive, got {}".format(blocksize))
+
+    return _row_blocks(
+        iter(records),
+        _key_layout(keys, default, dtype),
+        blocksize)
+
+def _row_blocks(records, layout, blocksize):
+    """
+    Fills blocks of rows with records, until they run out.
 
-    data_array = np.array(data_list)
+    Parameters
+    ----------
+    records: iterator of dicts.
+        The dictionaries to convert.
+    layout: tuple.
+        The layout of the rows, as returned by _key_layout.
+    blocksize: int.
+        The number of rows of the blocks.
 
-    return data_array
+    Returns
+    -------
+    out: generator.
+        The blocks ; the last one has the remaining rows.
+    """
+    __width, __columns, __duplicates, __defaults, __dtype = layout
+    while True:
+        __block = np.empty((blocksize, __width), dtype=__dtype)
+        __count = _fill_rows(
+            __block,
+            records,
+            __columns,
+            __duplicates,
+            __defaults)
+        if __count < blocksize:
+            if __count:
+                yield __block[:__count]
+            return
+        yield __block
 
 @typecheck
 def reshape_into_matrix(
@@ -151,3 +501,518 @@ def reshape_into_vector(
         a=data,
         newshape=(-1,),
         order='C')
+
+#####################################################################
+# KEY SCHEMA
+#####################################################################
+
+class KeySchema(object):
+    """
+    A list of axes keys, compiled once to convert dicts into arrays and
+    back : the column of each key is resolved in O(1), and each key has
+    its default value.
+
+    Can be passed in place of the keys to convert_dict_to_array and its
+    batch variants.
+
+    Parameters
+    ----------
+    keys: iterable.
+        The FULL list of axes keys ; they can be repeated.
+    default: numeric.
+        The value of the missing keys.
+    defaults: dict.
+        The values of specific missing keys, overriding default.
+    dtype: np.dtype.
+        The type of the values.
+    """
+    __slots__ = (
+        '_keys', '_names', '_firsts', '_defaults', '_layout', '_sparse')
+
+    def __init__(self, keys, default=0.0, defaults=None, dtype=np.float64):
+        self._keys = tuple(keys)
+
+        __width, __columns, __duplicates = _key_columns(self._keys)
+
+        __unknown = set(defaults or ()) - set(__columns)
+        if __unknown:
+            raise ValueError("defaults given for unknown keys {}".format(
+                ', '.join(sorted(map(repr, __unknown)))))
+
+        __defaults = np.array(
+            [(defaults or {}).get(__key, default) for __key in self._keys],
+            dtype=dtype)
+        __defaults.flags.writeable = False
+
+        self._names = tuple(__columns)
+        self._firsts = np.array(
+            [__columns[__name] for __name in self._names],
+            dtype=np.intp)
+        self._defaults = __defaults
+        self._layout = (
+            __width,
+            __columns,
+            __duplicates,
+            __defaults,
+            __defaults.dtype)
+
+        # only the zero defaults can be left out of the sparse rows
+        self._sparse = None
+        if not __defaults.any():
+            self._sparse = (
+                __width,
+                __columns,
+                _repeated_columns(__duplicates),
+                __defaults.dtype)
+
+    @property
+    def keys(self):
+        return self._keys
+
+    @property
+    def defaults(self):
+        return self._defaults
+
+    @property
+    def dtype(self):
+        return self._defaults.dtype
+
+    def index(self, key) -> int:
+        """
+        Returns the column of a key ; its first one, if it is repeated.
+        Raises KeyError for the unknown keys.
+        """
+        return self._layout[1][key]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __contains__(self, key):
+        return key in self._layout[1]
+
+    def __repr__(self):
+        return "KeySchema(size={}, dtype={})".format(len(self), self.dtype)
+
+    def _check_shape(self, array, ndim):
+        __array = np.asarray(array)
+        if __array.ndim != ndim or __array.shape[-1] != len(self._keys):
+            raise ValueError(
+                "expected {}-D arrays of {} columns, got shape {}".format(
+                    ndim,
+                    len(self._keys),
+                    __array.shape))
+        return __array
+
+    def to_array(self, data: dict, dtype=None, out=None) -> np.ndarray:
+        """
+        Converts a dict into an array, with a value per key.
+
+        Only the values present in the dict are looked up and written ;
+        the buffer is filled in place, without any allocation.
+
+        Parameters
+        ----------
+        data: dict.
+            The dictionary to convert ; the unknown keys are ignored.
+        dtype: np.dtype.
+            The type of the array ; the type of the schema by default.
+        out: np.ndarray.
+            The 1-D buffer to fill and return, with the size of the
+            schema.
+
+        Returns
+        -------
+        out: np.ndarray.
+            The array, with the size of the schema.
+        """
+        __width, __columns, __duplicates, __defaults, __dtype = self._layout
+        if out is None:
+            __array = np.empty(
+                __width,
+                dtype=__dtype if dtype is None else dtype)
+        else:
+            __array = self._check_shape(out, 1)
+        _fill_rows(
+            __array[np.newaxis],
+            iter((data,)),
+            __columns,
+            __duplicates,
+            __defaults)
+        return __array
+
+    def to_dict(self, array) -> dict:
+        """
+        Converts an array back into a dict.
+
+        Parameters
+        ----------
+        array: np.ndarray.
+            The values, with the size of the schema ; the repeated keys
+            are read from their first column.
+
+        Returns
+        -------
+        out: dict.
+            The values by key, as python scalars.
+        """
+        __array = self._check_shape(array, 1)
+        return dict(zip(self._names, __array[self._firsts].tolist()))
+
+    def to_array_batch(self, records) -> np.ndarray:
+        """
+        Converts dicts into a matrix, with a row per dict ; see
+        convert_dicts_to_array.
+        """
+        return convert_dicts_to_array(records=records, keys=self)
+
+    def to_dicts_batch(self, matrix) -> list:
+        """
+        Converts the rows of a matrix back into dicts.
+
+        Parameters
+        ----------
+        matrix: np.ndarray.
+            The values, with a row per dict and a column per key.
+
+        Returns
+        -------
+        out: list.
+            The dicts, as in to_dict.
+        """
+        __matrix = self._check_shape(matrix, 2)
+        __names = self._names
+        return [
+            dict(zip(__names, __row))
+            for __row in __matrix[:, self._firsts].tolist()]
+
+#####################################################################
+# SPARSE CONVERSION
+#####################################################################
+
+def _repeated_columns(duplicates):
+    """
+    Lists the other columns of the repeated keys, by first column.
+
+    Parameters
+    ----------
+    duplicates: tuple.
+        The (targets, sources) columns of the repeated keys, see
+        _key_columns ; or None.
+
+    Returns
+    -------
+    out: dict.
+        The tuple of the other columns, for each first column repeated.
+    """
+    __repeats = {}
+    if duplicates is not None:
+        for __target, __source in zip(*(__c.tolist() for __c in duplicates)):
+            __repeats[__source] = __repeats.get(__source, ()) + (__target,)
+    return __repeats
+
+def _sparse_layout(keys, dtype):
+    """
+    Resolves the layout of the sparse rows, unless it is compiled in a
+    schema.
+
+    Parameters
+    ----------
+    keys: iterable or KeySchema.
+        The FULL list of axes keys ; a schema must have zero defaults.
+    dtype: np.dtype.
+        The type of the values ; float64 by default, or the type of the
+        schema.
+
+    Returns
+    -------
+    out: tuple.
+        The number of columns, the column of each key, the other columns
+        of the repeated keys (see _repeated_columns) and the dtype.
+    """
+    if isinstance(keys, KeySchema):
+        if keys._sparse is None:
+            raise ValueError(
+                "the sparse conversion requires a schema with zero defaults")
+        __width, __columns, __repeats, __dtype = keys._sparse
+        return (
+            __width,
+            __columns,
+            __repeats,
+            __dtype if dtype is None else dtype)
+
+    __width, __columns, __duplicates = _key_columns(keys)
+    return (
+        __width,
+        __columns,
+        _repeated_columns(__duplicates),
+        np.float64 if dtype is None else dtype)
+
+def _sparse_row(data, columns, repeats, indices, values):
+    """
+    Appends the columns and values of the known keys of a dict.
+
+    Parameters
+    ----------
+    data: dict.
+        The dictionary to convert.
+    columns: dict.
+        The column of each key.
+    repeats: dict.
+        The other columns of the repeated keys.
+    indices: list.
+        The columns, appended in place.
+    values: list.
+        The values, appended in place.
+    """
+    for __key, __value in data.items():
+        __j = columns.get(__key, None)
+        if __j is not None:
+            indices.append(__j)
+            values.append(__value)
+            if repeats and __j in repeats:
+                for __k in repeats[__j]:
+                    indices.append(__k)
+                    values.append(__value)
+
+@typecheck
+def convert_dict_to_sparse(
+        data: dict,
+        keys: iterable,
+        dtype: anything = None) -> tuple:
+    """
+    Creates the sparse form of the array with the size of keys : only the
+    values of the keys present in the dict are listed, the missing ones
+    are zeros.
+
+    The cost depends on the size of the dict rather than on the number of
+    keys, provided the keys are compiled in a KeySchema.
+
+    Parameters
+    ----------
+    data: dict.
+        The dictionary to convert.
+    keys: list of string or KeySchema.
+        The FULL list of axes keys ; a schema must have zero defaults.
+    dtype: np.dtype.
+        The type of the values ; float64 by default, or the type of the
+        schema.
+
+    Returns
+    -------
+    out: tuple.
+        The (indices, values) arrays, sorted by index.
+    """
+    __width, __columns, __repeats, __dtype = _sparse_layout(keys, dtype)
+
+    __indices = []
+    __values = []
+    _sparse_row(data, __columns, __repeats, __indices, __values)
+
+    __indices = np.array(__indices, dtype=np.intp)
+    __values = np.array(__values, dtype=__dtype)
+    __order = np.argsort(__indices, kind='stable')
+
+    return __indices[__order], __values[__order]
+
+@typecheck
+def convert_dicts_to_sparse(
+        records: iterable,
+        keys: iterable,
+        dtype: anything = None):
+    """
+    Creates a sparse matrix from a batch of dicts, with a row per dict and
+    a column per key ; see convert_dict_to_sparse.
+
+    Parameters
+    ----------
+    records: iterable of dicts.
+        The dictionaries to convert.
+    keys: list of string or KeySchema.
+        The FULL list of axes keys ; a schema must have zero defaults.
+    dtype: np.dtype.
+        The type of the values ; float64 by default, or the type of the
+        schema.
+
+    Returns
+    -------
+    out: SparseBatch.
+        The matrix, in compressed sparse row format.
+    """
+    __width, __columns, __repeats, __dtype = _sparse_layout(keys, dtype)
+
+    __indptr = [0]
+    __indices = []
+    __values = []
+    for __record in records:
+        _sparse_row(__record, __columns, __repeats, __indices, __values)
+        __indptr.append(len(__indices))
+
+    __indptr = np.array(__indptr, dtype=np.intp)
+    __indices = np.array(__indices, dtype=np.intp)
+    __values = np.array(__values, dtype=__dtype)
+
+    # sorts the indices within each row
+    __order = np.lexsort((__indices, _row_ids(__indptr)))
+
+    return SparseBatch(
+        __indptr,
+        __indices[__order],
+        __values[__order],
+        (len(__indptr) - 1, __width))
+
+def _row_ids(indptr):
+    """
+    Returns the row of each stored value of a CSR matrix.
+    """
+    return np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+
+class SparseBatch(object):
+    """
+    A sparse matrix in compressed sparse row format : the values of the
+    row i are values[indptr[i]:indptr[i + 1]], in the columns
+    indices[indptr[i]:indptr[i + 1]]. The other values are zeros.
+
+    Built by convert_dicts_to_sparse ; the arrays are read-only.
+
+    Parameters
+    ----------
+    indptr: np.ndarray.
+        The start of each row in indices and values, and the end of the
+        last one.
+    indices: np.ndarray.
+        The columns of the stored values.
+    values: np.ndarray.
+        The stored values.
+    shape: tuple.
+        The (number of rows, number of columns) of the matrix.
+    """
+    __slots__ = ('_indptr', '_indices', '_values', '_shape')
+
+    def __init__(self, indptr, indices, values, shape):
+        __indptr = np.array(indptr, dtype=np.intp)
+        __indices = np.array(indices, dtype=np.intp)
+        __values = np.array(values)
+        __rows, __columns = shape
+
+        if __indptr.shape != (__rows + 1,) or __indptr[0] != 0 \
+                or __indptr[-1] != __indices.size \
+                or np.any(np.diff(__indptr) < 0):
+            raise ValueError("invalid row pointers for {} rows".format(__rows))
+
+        if __values.shape != __indices.shape or __indices.ndim != 1:
+            raise ValueError(
+                "the indices and values must be 1-D, of equal sizes")
+
+        if __indices.size and (
+                __indices.min() < 0 or __indices.max() >= __columns):
+            raise ValueError("column indices out of range")
+
+        for __array in (__indptr, __indices, __values):
+            __array.flags.writeable = False
+
+        self._indptr = __indptr
+        self._indices = __indices
+        self._values = __values
+        self._shape = (__rows, __columns)
+
+    @property
+    def indptr(self):
+        return self._indptr
+
+    @property
+    def indices(self):
+        return self._indices
+
+    @property
+    def values(self):
+        return self._values
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @property
+    def nnz(self):
+        return self._values.size
+
+    @property
+    def dtype(self):
+        return self._values.dtype
+
+    def __len__(self):
+        return self._shape[0]
+
+    def __repr__(self):
+        return "SparseBatch(shape={}, nnz={})".format(self._shape, self.nnz)
+
+    def row(self, i: int) -> tuple:
+        """
+        Returns the (indices, values) of a row, as in convert_dict_to_sparse.
+        """
+        __start, __stop = self._indptr[i], self._indptr[i + 1]
+        return self._indices[__start:__stop], self._values[__start:__stop]
+
+    def to_dense(self, out=None) -> np.ndarray:
+        """
+        Converts the matrix into a dense array.
+
+        Parameters
+        ----------
+        out: np.ndarray.
+            The 2-D buffer to fill and return, with the shape of the
+            matrix.
+
+        Returns
+        -------
+        out: np.ndarray.
+            The dense matrix.
+        """
+        if out is None:
+            out = np.zeros(self._shape, dtype=self._values.dtype)
+        elif out.shape != self._shape:
+            raise ValueError(
+                "expected an output buffer of shape {}, got {}".format(
+                    self._shape,
+                    out.shape))
+        else:
+            out.fill(0)
+
+        out[_row_ids(self._indptr), self._indices] = self._values
+        return out
+
+    def dot(self, vector) -> np.ndarray:
+        """
+        Multiplies the matrix by a vector, without densifying it.
+
+        Parameters
+        ----------
+        vector: np.ndarray.
+            A 1-D array, with a value per column.
+
+        Returns
+        -------
+        out: np.ndarray.
+            The product, with a value per row.
+        """
+        __vector = np.asarray(vector)
+        if __vector.shape != (self._shape[1],):
+            raise ValueError("expected a vector of shape {}, got {}".format(
+                (self._shape[1],),
+                __vector.shape))
+
+        __products = self._values * __vector[self._indices]
+        __result = np.zeros(self._shape[0], dtype=__products.dtype)
+
+        # reduceat can't sum empty segments : they stay zero
+        __filled = np.diff(self._indptr) > 0
+        if __products.size:
+            __result[__filled] = np.add.reduceat(
+                __products,
+                self._indptr[:-1][__filled])
+
+        return __result
+
+    __matmul__ = dot
@@ -1,20 +1,1902 @@
 # -*- coding: utf-8 -*-
 
+"""
+===========
+Memoization
+===========
+
+Function decorators caching the results of expensive calls.
+
+Examples
+--------
+    >>> @memoize
+    ... def fibonacci(n):
+    ...     return n if n < 2 else fibonacci(n - 1) + fibonacci(n - 2)
+    ...
+    >>> @memoize(maxsize=1024, policy='lfu')
+    ... def solve(equation):
+    ...     pass
+    ...
+    >>> solve.cache_info()
+    CacheInfo(hits=0, misses=0, evictions=0, maxsize=1024, currsize=0, currbytes=0)
+    >>> @memoize(disk='~/.cache/practical')
+    ... def simulate(parameters):
+    ...     pass
+"""
+
 from __future__ import division, print_function, absolute_import
 
-from decorator import decorator
+import asyncio
+import collections
+import concurrent.futures
+import functools
+import hashlib
+import inspect
+import multiprocessing.connection
+import numpy as np
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+import weakref
+
+from multiprocessing import resource_tracker, shared_memory
 
 #####################################################################
-# MEMOIZATION
+# CACHE STORES
 #####################################################################
 
-@decorator
-def memoize(func, *args, **kwargs):
-    if not hasattr(func, '__cache__'):
-        setattr(func, '__cache__', dict())
+MEMOIZE_POLICIES = ('lru', 'lfu')
+
+MEMOIZE_READONLY = (False, True, 'debug')
+
+CacheInfo = collections.namedtuple(
+    'CacheInfo',
+    ['hits', 'misses', 'evictions', 'maxsize', 'currsize', 'currbytes'])
+
+# marks the missing entries, since None is a valid result
+_MISSING = object()
+
+class _LRUStore(object):
+    """
+    Cache entries, evicted in least recently used order.
+    """
+    __slots__ = ('_entries',)
+
+    def __init__(self):
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        __value = self._entries.get(key, _MISSING)
+        if __value is not _MISSING:
+            self._entries.move_to_end(key)
+        return __value
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+
+    def pop_victim(self):
+        return self._entries.popitem(last=False)
+
+    def remove(self, key):
+        del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+class _LFUStore(object):
+    """
+    Cache entries, evicted in least frequently used order ; the ties are
+    broken by recency.
+
+    The keys are grouped in buckets of equal use count, so that both the
+    lookups and the evictions are O(1).
+    """
+    __slots__ = ('_entries', '_buckets', '_min_count')
+
+    def __init__(self):
+        self._entries = {}  # key => [value, count]
+        self._buckets = collections.defaultdict(collections.OrderedDict)
+        self._min_count = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _touch(self, key, entry):
+        __count = entry[1]
+        __bucket = self._buckets[__count]
+        del __bucket[key]
+        if not __bucket:
+            del self._buckets[__count]
+            if self._min_count == __count:
+                self._min_count = __count + 1
+        entry[1] = __count + 1
+        self._buckets[__count + 1][key] = None
+
+    def get(self, key):
+        __entry = self._entries.get(key, None)
+        if __entry is None:
+            return _MISSING
+        self._touch(key, __entry)
+        return __entry[0]
+
+    def put(self, key, value):
+        __entry = self._entries.get(key, None)
+        if __entry is None:
+            self._entries[key] = [value, 1]
+            self._buckets[1][key] = None
+            self._min_count = 1
+        else:
+            __entry[0] = value
+            self._touch(key, __entry)
+
+    def pop_victim(self):
+        __bucket = self._buckets[self._min_count]
+        __key, __none = __bucket.popitem(last=False)
+        if not __bucket:
+            del self._buckets[self._min_count]
+            self._min_count = min(self._buckets) if self._buckets else 0
+        return __key, self._entries.pop(__key)[0]
+
+    def remove(self, key):
+        __count = self._entries.pop(key)[1]
+        __bucket = self._buckets[__count]
+        del __bucket[key]
+        if not __bucket:
+            del self._buckets[__count]
+            if self._min_count == __count:
+                self._min_count = min(self._buckets) if self._buckets else 0
+
+    def clear(self):
+        self._entries.clear()
+        self._buckets.clear()
+        self._min_count = 0
+
+_STORES = {
+    'lru': _LRUStore,
+    'lfu': _LFUStore}
+
+# the process-wide byte budget, shared by all the memoize caches
+_BUDGET = {'maxbytes': None}
+
+# all the memoize caches, to enforce the process-wide budget
+_CACHES = weakref.WeakSet()
+
+_BUDGET_LOCK = threading.RLock()
+
+# number of locks guarding the computations in progress, per cache
+_STRIPES = 16
+
+class _Cache(object):
+    """
+    A memoization cache : a store bounded in size, in bytes and in time,
+    with statistics.
+
+    All the operations are thread-safe. Besides, the computations in
+    progress are registered in striped tables, see _single_flight, and
+    the coroutines in progress in the tasks table, see
+    _single_flight_async.
+
+    Parameters
+    ----------
+    maxsize: int.
+        The maximum number of entries ; None for unbounded.
+    policy: str.
+        The eviction policy, 'lru' or 'lfu'.
+    maxbytes: int.
+        The maximum estimated size of the entries, in bytes ; None for
+        unbounded.
+    ttl: float.
+        The lifetime of the entries, in seconds ; None for unlimited.
+    stripes: int.
+        The number of locks guarding the computations in progress.
+    """
+    __slots__ = (
+        'maxsize', 'maxbytes', 'ttl', 'store', 'sizes', 'deadlines',
+        'nbytes', 'hits', 'misses', 'evictions', 'lock', 'stripes',
+        'tasks', '__weakref__')
+
+    def __init__(
+            self,
+            maxsize=None,
+            policy='lru',
+            maxbytes=None,
+            ttl=None,
+            stripes=_STRIPES):
+        if policy not in MEMOIZE_POLICIES:
+            raise ValueError("unknown memoize policy '{}'".format(policy))
+
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.ttl = ttl
+        self.store = _STORES[policy]()
+        self.sizes = {}
+        # with a fixed ttl, the insertion order is the expiry order
+        self.deadlines = collections.OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.stripes = tuple(
+            (threading.Lock(), {})
+            for __i in range(stripes))
+        self.tasks = {}     # (event loop, key) => [task, number of awaiters]
+
+        with _BUDGET_LOCK:
+            _CACHES.add(self)
+
+    def get(self, key, record=True):
+        with self.lock:
+            __value = self.store.get(key)
+
+            if __value is not _MISSING and self.ttl is not None \
+                    and self.deadlines[key] <= time.monotonic():
+                self._remove(key)
+                self.evictions += 1
+                __value = _MISSING
+
+            if record:
+                if __value is not _MISSING:
+                    self.hits += 1
+                elif record != 'hits':
+                    self.misses += 1
+
+            return __value
+
+    def put(self, key, value):
+        if self.maxsize is not None and self.maxsize <= 0:
+            return
+
+        __size = 0
+        if self.maxbytes is not None or _BUDGET['maxbytes'] is not None:
+            __size = _size_of(value)
+            if __size > min(
+                    __b for __b in (self.maxbytes, _BUDGET['maxbytes'])
+                    if __b is not None):
+                return  # would never fit
+
+        with self.lock:
+            if key in self.sizes:
+                self._remove(key)
+
+            if self.ttl is not None:
+                self._expire()
+
+            # makes room first : inserted first, a new entry would be the
+            # least frequently used, and the next victim
+            while len(self.store) and (
+                    (self.maxsize is not None
+                    and len(self.store) >= self.maxsize)
+                    or (self.maxbytes is not None
+                    and self.nbytes + __size > self.maxbytes)):
+                self._evict()
+
+            self.store.put(key, value)
+            self.sizes[key] = __size
+            self.nbytes += __size
+            if self.ttl is not None:
+                self.deadlines[key] = time.monotonic() + self.ttl
+
+        if _BUDGET['maxbytes'] is not None:
+            _enforce_budget()
+
+    def stripe(self, key):
+        return self.stripes[hash(key) % len(self.stripes)]
+
+    def evict(self):
+        with self.lock:
+            if len(self.store):
+                self._evict()
+
+    def _expire(self):
+        __now = time.monotonic()
+        while self.deadlines:
+            __key, __deadline = next(iter(self.deadlines.items()))
+            if __deadline > __now:
+                break
+            self._remove(__key)
+            self.evictions += 1
+
+    def _evict(self):
+        __key, __value = self.store.pop_victim()
+        self._forget(__key)
+        self.evictions += 1
+
+    def _forget(self, key):
+        self.nbytes -= self.sizes.pop(key, 0)
+        self.deadlines.pop(key, None)
+
+    def _remove(self, key):
+        self.store.remove(key)
+        self._forget(key)
+
+    def info(self):
+        with self.lock:
+            return CacheInfo(
+                self.hits,
+                self.misses,
+                self.evictions,
+                self.maxsize,
+                len(self.store),
+                self.nbytes)
+
+    def clear(self):
+        with self.lock:
+            self.store.clear()
+            self.sizes.clear()
+            self.deadlines.clear()
+            self.nbytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+def _enforce_budget():
+    """
+    Evicts entries until all the caches fit in the process-wide budget,
+    starting with the largest caches.
+    """
+    with _BUDGET_LOCK:
+        __caches = [__c for __c in _CACHES if len(__c.store)]
+        __total = sum(__c.nbytes for __c in __caches)
+
+        while __caches and __total > _BUDGET['maxbytes']:
+            __largest = max(__caches, key=lambda __c: __c.nbytes)
+            __before = __largest.nbytes
+            __largest.evict()
+            __total -= __before - __largest.nbytes
+            if not len(__largest.store):
+                __caches.remove(__largest)
+
+def set_memoize_budget(
+        maxbytes: int = None) -> None:
+    """
+    Caps the total estimated size of all the memoize caches in the
+    process ; when it is exceeded, the largest caches evict first.
+
+    Only the entries cached while a budget is set are accounted for.
+
+    Parameters
+    ----------
+    maxbytes: int.
+        The budget in bytes ; None removes it.
+    """
+    _BUDGET['maxbytes'] = maxbytes
+    if maxbytes is not None:
+        _enforce_budget()
+
+#####################################################################
+# SIZE ESTIMATION
+#####################################################################
+
+@functools.singledispatch
+def _size_of(x):
+    """
+    Estimates the memory held by a cached value, in bytes.
+
+    Parameters
+    ----------
+    x:
+        The value.
+
+    Returns
+    -------
+    out: int.
+        The estimated size.
+    """
+    return sys.getsizeof(x)
+
+@_size_of.register(np.ndarray)
+def _ndarray_size(x):
+    """
+    Arrays are measured by their data ; the views don't own it, but keep
+    it alive.
+    """
+    return max(x.nbytes, sys.getsizeof(x))
+
+@_size_of.register(list)
+@_size_of.register(tuple)
+@_size_of.register(set)
+@_size_of.register(frozenset)
+def _sequence_size(x):
+    """
+    Containers are measured with their items.
+    """
+    return sys.getsizeof(x) + sum(map(_size_of, x))
+
+@_size_of.register(dict)
+def _dict_size(x):
+    """
+    Dicts are measured with their keys and values.
+    """
+    return (
+        sys.getsizeof(x)
+        + sum(map(_size_of, x.keys()))
+        + sum(map(_size_of, x.values())))
+
+#####################################################################
+# PERSISTENCE
+#####################################################################
+
+# seconds to wait for the other processes to release the database
+_DISK_TIMEOUT = 30.0
+
+_DISK_SCHEMA = """
+CREATE TABLE IF NOT EXISTS memoize (
+    name TEXT NOT NULL,
+    version TEXT NOT NULL,
+    key TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    value BLOB NOT NULL,
+    PRIMARY KEY (name, version, key))
+"""
+
+class _UnstableKey(Exception):
+    """
+    Raised on the cache keys which hold the address of an object, in a
+    default repr : they never match in another process, or after the
+    object is collected.
+    """
+
+def _stable_encode(x, out):
+    """
+    Serializes a cache key into bytes which don't depend on the process:
+    the sets are sorted, the types are named and the other values are
+    written with their repr ; raises _UnstableKey on a repr holding an
+    address, like '<object at 0x...>'.
+
+    Parameters
+    ----------
+    x:
+        A cache key, or a part of it.
+    out: list.
+        The byte strings written so far, appended in place.
+    """
+    if type(x) is tuple:
+        out.append(b'(')
+        for __item in x:
+            _stable_encode(__item, out)
+        out.append(b')')
+    elif type(x) is frozenset:
+        __items = []
+        for __item in x:
+            __encoded = []
+            _stable_encode(__item, __encoded)
+            __items.append(b''.join(__encoded))
+        out.append(b'{')
+        out.extend(sorted(__items))
+        out.append(b'}')
+    elif x is _KWARGS_MARK:
+        out.append(b'*')
+    else:
+        if type(x) is bytes:
+            __data = x
+        elif isinstance(x, type):
+            __data = '{}.{}'.format(x.__module__, x.__qualname__).encode()
+        else:
+            __data = repr(x).encode('utf-8', 'backslashreplace')
+            if b' at 0x' in __data:
+                raise _UnstableKey()
+        out.append('{}:{}:'.format(type(x).__name__, len(__data)).encode())
+        out.append(__data)
+
+def _stable_digest(key):
+    """
+    Hashes a cache key, consistently across the processes.
+
+    Values whose repr depends on their identity would never match : they
+    have no digest, and are neither persisted nor shared.
+
+    Parameters
+    ----------
+    key: tuple.
+        The cache key.
+
+    Returns
+    -------
+    out: str.
+        The hex digest of the key ; None if it is not stable.
+    """
+    __encoded = []
+    try:
+        _stable_encode(key, __encoded)
+    except _UnstableKey:
+        return None
+    return hashlib.sha256(b''.join(__encoded)).hexdigest()
+
+def _code_version(func):
+    """
+    Fingerprints the code of a function, so that editing it invalidates
+    its persisted results.
+
+    Parameters
+    ----------
+    func: callable.
+        The memoized function.
+
+    Returns
+    -------
+    out: str.
+        A digest of its source, or of its bytecode when the source is not
+        available.
+    """
+    try:
+        __source = inspect.getsource(func).encode()
+    except (OSError, TypeError):
+        __code = getattr(func, '__code__', None)
+        __source = (
+            __code.co_code + repr(__code.co_consts).encode()
+            if __code is not None else repr(func).encode())
+    return hashlib.sha256(__source).hexdigest()[:16]
+
+class _DiskStore(object):
+    """
+    The persistent tier of a memoization cache, in a directory shared by
+    all the processes of the host.
+
+    The results are indexed in a SQLite database ; the arrays are saved
+    to .npy files next to it, and memory-mapped read-only when loaded.
+    The other results are pickled into the database.
+
+    The database runs in WAL mode, so that the readers don't block the
+    writer ; the array files are written aside and moved in place, so
+    that the readers never see a partial file.
+
+    Parameters
+    ----------
+    path: str.
+        The cache directory, created if needed.
+    name: str.
+        The qualified name of the memoized function.
+    version: str.
+        The version of its code ; the entries of the other versions are
+        deleted on opening.
+    """
+    __slots__ = ('path', 'name', 'version', 'arrays', '_local')
+
+    def __init__(self, path, name, version):
+        self.path = os.path.abspath(os.path.expanduser(os.fspath(path)))
+        self.name = name
+        self.version = version
+        self.arrays = os.path.join(self.path, 'arrays')
+        self._local = threading.local()
+
+        os.makedirs(self.arrays, exist_ok=True)
+        self._purge()
+
+    def _connection(self):
+        # sqlite connections can't be shared by the threads, nor survive
+        # a fork
+        __pid = os.getpid()
+        if getattr(self._local, 'pid', None) != __pid:
+            __connection = sqlite3.connect(
+                os.path.join(self.path, 'memoize.sqlite'),
+                timeout=_DISK_TIMEOUT,
+                isolation_level=None)
+            __connection.execute('PRAGMA journal_mode=WAL')
+            __connection.execute('PRAGMA synchronous=NORMAL')
+            __connection.execute(_DISK_SCHEMA)
+            self._local.connection = __connection
+            self._local.pid = __pid
+        return self._local.connection
+
+    def _delete(self, condition, parameters):
+        __connection = self._connection()
+        __files = __connection.execute(
+            "SELECT value FROM memoize WHERE kind = 'npy' AND " + condition,
+            parameters).fetchall()
+        __connection.execute(
+            'DELETE FROM memoize WHERE ' + condition,
+            parameters)
+        for __file, in __files:
+            try:
+                os.remove(os.path.join(self.arrays, __file))
+            except OSError:
+                pass    # removed by another process
+
+    def _purge(self):
+        self._delete(
+            'name = ? AND version != ?',
+            (self.name, self.version))
+
+    def get(self, key):
+        __digest = _stable_digest(key)
+        if __digest is None:
+            return _MISSING
+        __row = self._connection().execute(
+            'SELECT kind, value FROM memoize '
+            'WHERE name = ? AND version = ? AND key = ?',
+            (self.name, self.version, __digest)).fetchone()
+        if __row is None:
+            return _MISSING
+
+        __kind, __value = __row
+        try:
+            if __kind == 'npy':
+                return np.load(
+                    os.path.join(self.arrays, __value),
+                    mmap_mode='r',
+                    allow_pickle=False)
+            return pickle.loads(__value)
+        except Exception:
+            return _MISSING     # deleted, or no longer loadable : recompute
+
+    def put(self, key, value):
+        __digest = _stable_digest(key)
+        if __digest is None:
+            return  # could never be read back
+
+        if isinstance(value, np.ndarray) and not value.dtype.hasobject:
+            __kind = 'npy'
+            __value = '{}-{}.npy'.format(
+                hashlib.sha256(
+                    '{}:{}'.format(self.name, self.version).encode()
+                ).hexdigest()[:16],
+                __digest)
+            __path = os.path.join(self.arrays, __value)
+            __temporary = '{}.{}.{}.tmp'.format(
+                __path, os.getpid(), threading.get_ident())
+            with open(__temporary, 'wb') as __file:
+                np.save(__file, value, allow_pickle=False)
+            os.replace(__temporary, __path)
+        else:
+            __kind = 'pickle'
+            try:
+                __value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                return  # only cached in memory
+
+        self._connection().execute(
+            'INSERT OR REPLACE INTO memoize VALUES (?, ?, ?, ?, ?)',
+            (self.name, self.version, __digest, __kind, __value))
+
+    def clear(self):
+        self._delete(
+            'name = ? AND version = ?',
+            (self.name, self.version))
+
+#####################################################################
+# SHARED CACHE
+#####################################################################
+
+WorkerCacheInfo = collections.namedtuple(
+    'WorkerCacheInfo',
+    ['hits', 'misses', 'hit_rate'])
+
+# the arrays larger than this are stored in shared memory segments, the
+# other results are pickled inline
+_SHARED_INLINE_BYTES = 1 << 16
+
+# the connection of the current process to the shared cache
+_SHARED = {'address': None, 'authkey': None, 'client': None}
+
+_SHARED_LOCK = threading.Lock()
+
+# the requests the server answers, by name of method without underscore
+_SHARED_OPERATIONS = frozenset(['get', 'put'])
+
+# the failures of the shared cache, which fall back to computing
+_SHARED_ERRORS = (OSError, EOFError, RuntimeError)
+
+# owns the segments of the servers of the process : the tracker unlinks
+# them if the process dies without closing its servers ; the tracker
+# of the clients can't, since they unregister the segments they attach
+_SEGMENT_TRACKER = resource_tracker.ResourceTracker()
+
+class _Segment(shared_memory.SharedMemory):
+    """
+    A shared memory segment, mapped as long as the arrays read from it.
+
+    The arrays read from the shared cache are views of the mappings of
+    the segments : they are unmapped with the last array, and never
+    unlinked on exit, which would pull them from the other processes.
+    The server unlinks them when it evicts them or is closed.
+    """
+
+    def __init__(self, name=None, create=False, size=0):
+        super(_Segment, self).__init__(name=name, create=create, size=size)
+        # the mapping doesn't need the descriptor
+        if getattr(self, '_fd', -1) >= 0:
+            os.close(self._fd)
+            self._fd = -1
+        # before python 3.13, each process attaching a segment unlinks it
+        # on exit
+        resource_tracker.unregister(self._name, 'shared_memory')
+
+    def __del__(self):
+        pass
+
+def _array_descriptor(x):
+    return (np.lib.format.dtype_to_descr(x.dtype), x.shape)
+
+def _array_from_descriptor(descriptor, buffer):
+    __descr, __shape = descriptor
+    __array = np.ndarray(
+        __shape,
+        dtype=np.lib.format.descr_to_dtype(__descr),
+        buffer=buffer)
+    __array.flags.writeable = False
+    return __array
+
+class _SharedClient(object):
+    """
+    The connection of a process to the shared cache server, shared by its
+    threads.
+
+    Parameters
+    ----------
+    address: str or tuple.
+        The address of the server.
+    authkey: bytes.
+        The authentication key of the server.
+    """
+    __slots__ = ('pid', 'connection', 'lock', 'segments')
+
+    def __init__(self, address, authkey):
+        self.pid = os.getpid()
+        self.connection = multiprocessing.connection.Client(
+            address,
+            authkey=authkey)
+        self.lock = threading.Lock()
+        # name => mapping of the segment, kept alive by the arrays
+        self.segments = weakref.WeakValueDictionary()
+
+    def request(self, operation, *args):
+        with self.lock:
+            self.connection.send((operation, args))
+            __status, __result = self.connection.recv()
+        if __status != 'ok':
+            raise RuntimeError(
+                "the shared memoize cache failed: {}".format(__result))
+        return __result
+
+    def get(self, name, digest):
+        __entry = self.request('get', name, digest, self.pid)
+        if __entry is None:
+            return _MISSING
+
+        __kind, __data = __entry
+        if __kind == 'pickle':
+            return pickle.loads(__data)
+
+        __segment_name, __descriptor = __data
+        __mapping = self.segments.get(__segment_name, None)
+        if __mapping is None:
+            try:
+                __mapping = _Segment(__segment_name).buf.obj
+            except FileNotFoundError:
+                return _MISSING     # evicted in the meantime
+            self.segments[__segment_name] = __mapping
+        return _array_from_descriptor(__descriptor, __mapping)
+
+    def put(self, name, digest, value):
+        if isinstance(value, np.ndarray) and not value.dtype.hasobject \
+                and value.nbytes > _SHARED_INLINE_BYTES:
+            __segment = _Segment(create=True, size=value.nbytes)
+            __descriptor = _array_descriptor(value)
+            __copy = np.ndarray(
+                value.shape,
+                dtype=value.dtype,
+                buffer=__segment.buf)
+            __copy[...] = value
+            del __copy
+            __entry = ('array', (__segment.name, __descriptor))
+            __accepted = False
+            try:
+                __accepted = self.request('put', name, digest, __entry)
+            finally:
+                # the caller has the value : the mapping isn't needed
+                __segment.close()
+                if not __accepted:
+                    __segment.unlink()  # failed, or another was faster
+        else:
+            try:
+                __data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                return  # only cached in memory
+            self.request('put', name, digest, ('pickle', __data))
+
+def _shared_client():
+    """
+    Returns the connection of the current process to the shared cache,
+    opening it on first use ; the children of a fork reconnect.
+
+    Returns
+    -------
+    out: _SharedClient.
+        The connection ; None if the process is not connected.
+    """
+    __client = _SHARED['client']
+    if __client is not None and __client.pid == os.getpid():
+        return __client
+
+    with _SHARED_LOCK:
+        __client = _SHARED['client']
+        if __client is None or __client.pid != os.getpid():
+            __client = None
+            if _SHARED['address'] is not None:
+                __client = _SharedClient(
+                    _SHARED['address'],
+                    _SHARED['authkey'])
+            _SHARED['client'] = __client
+        return __client
+
+def _drop_shared_client(client):
+    """
+    Closes a broken connection to the shared cache ; the next call
+    reconnects.
+
+    Parameters
+    ----------
+    client: _SharedClient.
+        The connection, as returned by _shared_client.
+    """
+    with _SHARED_LOCK:
+        if _SHARED['client'] is client:
+            _SHARED['client'] = None
+    try:
+        client.connection.close()
+    except OSError:
+        pass
+
+def connect_shared_cache(
+        address=None,
+        authkey: bytes = None) -> None:
+    """
+    Connects the current process to a shared cache server ; the
+    functions memoized with shared=True then share their results with
+    the other connected processes.
+
+    Meant as the initializer of the pool workers:
+        >>> server = SharedCacheServer()
+        >>> pool = multiprocessing.Pool(
+        ...     initializer=connect_shared_cache,
+        ...     initargs=(server.address, server.authkey))
+
+    The processes forked after the connection are connected too.
+
+    Parameters
+    ----------
+    address: str or tuple.
+        The address of the server ; None disconnects the process.
+    authkey: bytes.
+        The authentication key of the server.
+    """
+    with _SHARED_LOCK:
+        _SHARED['address'] = address
+        _SHARED['authkey'] = authkey
+        _SHARED['client'] = None
+
+class _SharedTier(object):
+    """
+    The shared tier of a memoization cache, backed by the server the
+    process is connected to ; inactive when it isn't.
+
+    The failures of the server are not reported : the results are
+    computed instead.
+
+    Parameters
+    ----------
+    name: str.
+        The qualified name and version of the memoized function.
+    """
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def get(self, key):
+        __digest = _stable_digest(key)
+        if __digest is None:
+            return _MISSING
+
+        __client = None
+        try:
+            __client = _shared_client()
+            if __client is None:
+                return _MISSING
+            return __client.get(self.name, __digest)
+        except _SHARED_ERRORS as __error:
+            if __client is not None and not isinstance(__error, RuntimeError):
+                _drop_shared_client(__client)
+            return _MISSING
+
+    def put(self, key, value):
+        __digest = _stable_digest(key)
+        if __digest is None:
+            return
+
+        __client = None
+        try:
+            __client = _shared_client()
+            if __client is not None:
+                __client.put(self.name, __digest, value)
+        except _SHARED_ERRORS as __error:
+            if __client is not None and not isinstance(__error, RuntimeError):
+                _drop_shared_client(__client)
+
+class SharedCacheServer(object):
+    """
+    Serves a memoization cache to the processes of the host, typically
+    the workers of a pool ; see connect_shared_cache.
+
+    The server runs on background threads of the current process. The
+    small results are stored inline, the large arrays in shared memory
+    segments : the workers read them without copy, as read-only arrays.
+
+    The hits and misses are counted per worker process.
+
+    The shared memory is released when the server is closed, or when
+    its process dies.
+
+    Parameters
+    ----------
+    address: str or tuple.
+        The address to listen on ; by default, a new local socket.
+    authkey: bytes.
+        The key the clients must authenticate with ; random by default.
+    maxsize: int.
+        The maximum number of results, the least recently used are
+        evicted ; unbounded by default.
+    """
+
+    def __init__(self, address=None, authkey=None, maxsize=None):
+        self.authkey = authkey if authkey is not None else os.urandom(32)
+        self.maxsize = maxsize
+        self._listener = multiprocessing.connection.Listener(
+            address,
+            authkey=self.authkey)
+        self.address = self._listener.address
+        # (name, digest) => entry, from the least recently used
+        self._entries = collections.OrderedDict()
+        self._workers = collections.defaultdict(lambda: [0, 0])
+        self._lock = threading.Lock()
+        self._closed = False
+        self._servers = []
+        self._thread = threading.Thread(target=self._accept, daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _accept(self):
+        while True:
+            try:
+                __connection = self._listener.accept()
+            except (OSError, EOFError, multiprocessing.AuthenticationError):
+                if self._closed:
+                    return
+                continue
+            if self._closed:
+                __connection.close()
+                return
+            __server = threading.Thread(
+                target=self._serve,
+                args=(__connection,),
+                daemon=True)
+            with self._lock:
+                self._servers = [
+                    __s for __s in self._servers if __s.is_alive()]
+                self._servers.append(__server)
+            __server.start()
+
+    def _serve(self, connection):
+        with connection:
+            while not self._closed:
+                try:
+                    # wakes up regularly to notice the server was closed
+                    if not connection.poll(0.1):
+                        continue
+                    __operation, __args = connection.recv()
+                except (OSError, EOFError):
+                    return
+                if self._closed:
+                    return
+                try:
+                    if __operation not in _SHARED_OPERATIONS:
+                        raise ValueError(
+                            "unknown operation {}".format(__operation))
+                    __response = (
+                        'ok',
+                        getattr(self, '_' + __operation)(*__args))
+                except Exception as __error:
+                    __response = ('error', repr(__error))
+                connection.send(__response)
+
+    def _get(self, name, digest, worker):
+        with self._lock:
+            __entry = self._entries.get((name, digest), None)
+            self._workers[worker][__entry is None] += 1
+            if __entry is not None:
+                self._entries.move_to_end((name, digest))
+            return __entry
+
+    def _put(self, name, digest, entry):
+        __evicted = []
+        with self._lock:
+            if self._closed or (name, digest) in self._entries:
+                return False
+            if self.maxsize is not None and self.maxsize <= 0:
+                return False
+            if entry[0] == 'array':
+                _SEGMENT_TRACKER.register(entry[1][0], 'shared_memory')
+            self._entries[(name, digest)] = entry
+            while self.maxsize is not None \
+                    and len(self._entries) > self.maxsize:
+                __evicted.append(self._entries.popitem(last=False)[1])
+        _release_segments(__evicted)
+        return True
+
+    def info(self) -> dict:
+        """
+        Reports the use of the cache by each worker.
+
+        Returns
+        -------
+        out: dict.
+            The WorkerCacheInfo of each worker, by process id.
+        """
+        with self._lock:
+            return {
+                __worker: WorkerCacheInfo(
+                    __hits,
+                    __misses,
+                    __hits / (__hits + __misses))
+                for __worker, (__hits, __misses) in self._workers.items()}
+
+    def clear(self) -> None:
+        """
+        Empties the cache and resets the statistics ; the arrays already
+        returned stay valid.
+        """
+        with self._lock:
+            __entries = list(self._entries.values())
+            self._entries.clear()
+            self._workers.clear()
+        _release_segments(__entries)
+
+    def close(self) -> None:
+        """
+        Stops the server, disconnects the clients and releases the shared
+        memory.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        try:    # wakes the listening thread up
+            multiprocessing.connection.Client(
+                self.address,
+                authkey=self.authkey).close()
+        except OSError:
+            pass
+        self._thread.join()
+        self._listener.close()
+        with self._lock:
+            __servers, self._servers = self._servers, []
+        for __server in __servers:
+            __server.join()
+        self.clear()
+
+def _release_segments(entries):
+    """
+    Unlinks the shared memory segments of evicted entries ; the arrays
+    already returned stay valid.
+
+    Parameters
+    ----------
+    entries: list.
+        The entries of a SharedCacheServer.
+    """
+    for __kind, __data in entries:
+        if __kind != 'array':
+            continue
+        __name = __data[0]
+        _SEGMENT_TRACKER.unregister(__name, 'shared_memory')
+        try:
+            __segment = shared_memory.SharedMemory(__name)
+        except OSError:
+            continue
+        __segment.close()
+        __segment.unlink()
+
+#####################################################################
+# MEMOIZATION
+#####################################################################
+
+# separates the positional and keyword arguments in the cache keys
+_KWARGS_MARK = object()
+
+# the types which are their own key, without dispatching
+_ATOMIC_TYPES = frozenset([
+    bool, int, float, complex, str, bytes, type(None)])
+
+@functools.singledispatch
+def _key_of(x):
+    """
+    Builds a hashable key from an argument value.
+
+    Hashable values are their own key ; this includes the sympy
+    expressions, whose hash is structural and cached. The containers,
+    tuples included, are keyed by content, with the types of their
+    items. The other types are dispatched to the registered key
+    builders, and default to their string representation.
+
+    Parameters
+    ----------
+    x:
+        An argument value.
+
+    Returns
+    -------
+    out:
+        A hashable key, equal for equal arguments.
+    """
+    try:
+        hash(x)
+    except TypeError:
+        return (type(x), str(x))
+    else:
+        return x
+
+def _item_key(x):
+    """
+    Keys an item nested in an argument, with its type ; so that [1],
+    [1.0] and [True] are cached separately, like 1, 1.0 and True.
+    """
+    if type(x) in _ATOMIC_TYPES:
+        return (x, type(x))
+    return (_key_of(x), type(x))
+
+@_key_of.register(np.ndarray)
+def _ndarray_key(x):
+    """
+    Keys arrays by dtype, shape and a digest of their buffer ; unlike
+    their repr, which elides the middle of large arrays.
+    """
+    if x.dtype.hasobject:
+        return (np.ndarray, x.shape, tuple(map(_item_key, x.flat)))
+
+    return (
+        np.ndarray,
+        x.dtype.str,
+        x.shape,
+        hashlib.sha256(np.ascontiguousarray(x).view(np.uint8)).digest())
+
+@_key_of.register(dict)
+def _dict_key(x):
+    """
+    Keys dicts by content, regardless of the insertion order.
+    """
+    return (dict, frozenset(
+        (_item_key(__k), _item_key(__v)) for __k, __v in x.items()))
+
+@_key_of.register(list)
+def _list_key(x):
+    """
+    Keys lists by content.
+    """
+    return (list, tuple(map(_item_key, x)))
+
+@_key_of.register(tuple)
+def _tuple_key(x):
+    """
+    Keys tuples by content ; the arrays they hold are digested too.
+    """
+    return (tuple, tuple(map(_item_key, x)))
+
+@_key_of.register(set)
+@_key_of.register(frozenset)
+def _set_key(x):
+    """
+    Keys sets by content.
+    """
+    return (type(x), frozenset(map(_item_key, x)))
+
+def register_key_builder(
+        cls: type,
+        builder: callable) -> None:
+    """
+    Registers the function building the cache keys for the instances of
+    a type, and its subclasses.
+
+    Parameters
+    ----------
+    cls: type.
+        The type of the arguments.
+    builder: callable.
+        Takes an instance of cls and returns a hashable key ; equal
+        arguments must give equal keys.
+    """
+    _key_of.register(cls, builder)
+
+def _make_key(args, kwargs):
+    """
+    Builds the cache key of a call.
+
+    The types of the arguments are part of the key, so that f(1),
+    f(1.0) and f(True) are cached separately.
+
+    Parameters
+    ----------
+    args: tuple.
+        The positional arguments.
+    kwargs: dict.
+        The keyword arguments.
+
+    Returns
+    -------
+    out: tuple.
+        The cache key.
+    """
+    if not (args or kwargs):
+        return ()
+
+    __key = tuple([
+        __arg if type(__arg) in _ATOMIC_TYPES else _key_of(__arg)
+        for __arg in args]) + tuple(map(type, args))
+
+    if kwargs:
+        __key += (_KWARGS_MARK,) + tuple(sorted(
+            (__name, _key_of(__value), type(__value))
+            for __name, __value in kwargs.items()))
+
+    return __key
+
+class _Flight(object):
+    """
+    A computation in progress, awaited by the concurrent calls missing
+    on the same key.
+    """
+    __slots__ = ('owner', 'done', 'value', 'error')
+
+    def __init__(self):
+        self.owner = threading.get_ident()
+        self.done = threading.Event()
+        self.value = _MISSING
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+def _single_flight(cache, key, compute):
+    """
+    Computes a missing value once for all the threads asking for it at
+    the same time : the first one runs the computation, the others wait
+    for its result. The exceptions are raised in all the waiting threads,
+    and nothing is cached.
+
+    The computations in progress are guarded by striped locks, so that
+    the misses on unrelated keys don't wait for each other.
+
+    Parameters
+    ----------
+    cache: _Cache.
+        The cache missing the value.
+    key: tuple.
+        The cache key.
+    compute: callable.
+        Computes the value, without arguments.
+
+    Returns
+    -------
+    out:
+        The value.
+    """
+    __lock, __flights = cache.stripe(key)
+
+    with __lock:
+        __flight = __flights.get(key, None)
+        __leader = __flight is None
+        if __leader:
+            __value = cache.get(key, record=False)
+            if __value is not _MISSING:     # completed in the meantime
+                return __value
+            __flight = __flights[key] = _Flight()
+
+    if not __leader:
+        if __flight.owner == threading.get_ident():
+            return compute()    # recursion on the same key
+        return __flight.wait()
+
+    try:
+        __flight.value = compute()
+        cache.put(key, __flight.value)
+        return __flight.value
+    except BaseException as __error:
+        __flight.error = __error
+        raise
+    finally:
+        with __lock:
+            del __flights[key]
+        __flight.done.set()
+
+def _lookup_tiers(tiers, key):
+    """
+    Looks a missing value up in the slower tiers of a cache, and copies
+    it into the faster ones.
+
+    Parameters
+    ----------
+    tiers: tuple.
+        The tiers, from the fastest to the slowest.
+    key: tuple.
+        The cache key.
+
+    Returns
+    -------
+    out:
+        The value ; _MISSING if no tier has it.
+    """
+    for __i, __tier in enumerate(tiers):
+        __value = __tier.get(key)
+        if __value is not _MISSING:
+            for __faster in tiers[:__i]:
+                __faster.put(key, __value)
+            return __value
+    return _MISSING
+
+def _call_through(tiers, key, func, args, kwargs):
+    """
+    Computes a value missing from the memory, unless the slower tiers
+    have it ; the result is stored in all the tiers.
+    """
+    __value = _lookup_tiers(tiers, key)
+    if __value is _MISSING:
+        __value = func(*args, **kwargs)
+        for __tier in tiers:
+            __tier.put(key, __value)
+    return __value
+
+async def _call_through_async(tiers, key, func, args, kwargs):
+    """
+    Awaits a value missing from the memory, unless the slower tiers have
+    it ; the result is stored in all the tiers.
+    """
+    __value = _lookup_tiers(tiers, key)
+    if __value is _MISSING:
+        __value = await func(*args, **kwargs)
+        for __tier in tiers:
+            __tier.put(key, __value)
+    return __value
+
+async def _single_flight_async(cache, key, compute):
+    """
+    Awaits a missing value, computed by a single task for all the
+    coroutines asking for it at the same time, on the same event loop.
+
+    Cancelling an awaiter doesn't cancel the shared task, unless it was
+    the last one awaiting it. The exceptions, cancellation included, are
+    raised in all the awaiters, and nothing is cached.
+
+    Parameters
+    ----------
+    cache: _Cache.
+        The cache missing the value.
+    key: tuple.
+        The cache key.
+    compute: callable.
+        Returns the coroutine computing the value, without arguments.
+
+    Returns
+    -------
+    out:
+        The value.
+    """
+    __loop = asyncio.get_running_loop()
+    __task_key = (__loop, key)
+    __flight = cache.tasks.get(__task_key, None)
+
+    if __flight is None:
+        async def __compute():
+            __value = await compute()
+            cache.put(key, __value)
+            return __value
+
+        __flight = [__loop.create_task(__compute()), 0]
+        cache.tasks[__task_key] = __flight
+
+        def __done(task):
+            if cache.tasks.get(__task_key, None) is __flight:
+                del cache.tasks[__task_key]
+
+        __flight[0].add_done_callback(__done)
+
+    __flight[1] += 1
+    try:
+        return await asyncio.shield(__flight[0])
+    finally:
+        __flight[1] -= 1
+        if not __flight[1] and not __flight[0].done():
+            __flight[0].cancel()    # nobody is waiting anymore
+            # the next callers start afresh, instead of joining the
+            # cancelled task before its done callback runs
+            if cache.tasks.get(__task_key, None) is __flight:
+                del cache.tasks[__task_key]
+
+def _report_mutation(array):
+    raise ValueError(
+        "the arrays cached by '{}' are read-only ; copy them before "
+        "modifying them".format(array._origin))
+
+class _CachedArray(np.ndarray):
+    """
+    A read-only view of a cached array, which names the memoized function
+    it comes from when modified ; see memoize(readonly='debug').
+
+    The results computed from it are plain arrays, and so are its copies.
+    """
+
+    def __array_finalize__(self, obj):
+        self._origin = getattr(obj, '_origin', None)
+
+    def __setitem__(self, index, value):
+        try:
+            super(_CachedArray, self).__setitem__(index, value)
+        except ValueError:
+            if self.flags.writeable:
+                raise
+            _report_mutation(self)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, out=None, **kwargs):
+        if out is not None:
+            for __array in out:
+                if isinstance(__array, _CachedArray) \
+                        and not __array.flags.writeable:
+                    _report_mutation(__array)
+            kwargs['out'] = tuple(
+                __array.view(np.ndarray)
+                if isinstance(__array, _CachedArray) else __array
+                for __array in out)
+        return getattr(ufunc, method)(*(
+            __input.view(np.ndarray)
+            if isinstance(__input, _CachedArray) else __input
+            for __input in inputs), **kwargs)
+
+    def copy(self, order='C'):
+        return self.view(np.ndarray).copy(order=order)
+
+def _readonly_result(value, origin=None):
+    """
+    Protects the arrays in a cached result : they are marked read-only,
+    and each caller gets its own view of them, without copy.
+
+    Parameters
+    ----------
+    value:
+        The cached result ; the arrays and tuples are protected, the other
+        values are returned as they are.
+    origin: str.
+        The name of the memoized function, to report the attempts to
+        modify the arrays ; None to let numpy refuse them silently.
+
+    Returns
+    -------
+    out:
+        The protected result.
+    """
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+        if origin is None:
+            return value.view()
+        __view = value.view(_CachedArray)
+        __view._origin = origin
+        return __view
+    if type(value) is tuple:
+        return tuple(_readonly_result(__item, origin) for __item in value)
+    return value
+
+def memoize(
+        func=None,
+        *,
+        maxsize=None,
+        policy='lru',
+        maxbytes=None,
+        ttl=None,
+        disk=None,
+        shared=False,
+        version=None,
+        readonly=False):
+    """
+    Function decorator. Caches the results of the decorated function,
+    keyed by its arguments.
+
+    Can be used bare, or with options:
+        >>> @memoize(maxsize=256)
+        ... def f(x):
+        ...     pass
+
+    The cache is also bounded by the process-wide budget, if any ; see
+    set_memoize_budget.
+
+    The decorated function is thread-safe : concurrent calls missing on
+    the same arguments wait for a single computation.
+
+    Coroutine functions are memoized too : the awaited results are
+    cached, and the concurrent awaiters of the same arguments share a
+    single task.
+
+    With a disk directory, the results also persist across the restarts,
+    and are shared by all the processes using the same directory. They
+    are keyed by the qualified name of the function and a digest of its
+    source, so editing the function invalidates them. The arrays are
+    loaded as read-only memory maps.
+
+    With shared=True, the results are also shared by the processes
+    connected to the same SharedCacheServer, such as the workers of a
+    pool ; see connect_shared_cache. The large arrays are read from
+    shared memory, without copy. The tiers are looked up from the
+    fastest : memory, shared cache, then disk.
+
+    With readonly=True, the cached arrays are marked read-only, and each
+    call returns a new view of them : the hits are zero-copy, and the
+    callers can't corrupt the cache. With readonly='debug', the attempts
+    to modify them also name the memoized function.
+
+    Parameters
+    ----------
+    func: callable.
+        The function to memoize.
+    maxsize: int.
+        The maximum number of cached results ; unbounded when None.
+    policy: str.
+        Which entry to evict when the cache is full:
+        - 'lru': the least recently used.
+        - 'lfu': the least frequently used.
+    maxbytes: int.
+        The maximum estimated size of the cached results, in bytes. The
+        arrays are measured by their nbytes, the containers with their
+        items ; results larger than the whole budget are not cached.
+    ttl: float.
+        The lifetime of the cached results, in seconds ; only applies to
+        the memory tier.
+    disk: str.
+        The directory of the persistent tier ; none when None.
+    shared: bool.
+        Whether to use the shared cache the process is connected to.
+    version: str.
+        Identifies the code of the function in the persistent and shared
+        tiers ; defaults to a digest of its source.
+    readonly: bool or str.
+        Whether to protect the arrays in the results, see above:
+        - False: the callers share the cached arrays.
+        - True: the callers get read-only views of them.
+        - 'debug': the views also report the attempts to modify them.
+
+    Returns
+    -------
+    out: callable.
+        The decorated function, with the methods:
+        - cache_info(): the hits, misses, evictions, maxsize, currsize
+          and currbytes.
+        - cache_clear(): empties the cache and resets the statistics.
+        - disk_clear(): empties the persistent tier, if any.
+    """
+    if func is None:
+        return functools.partial(
+            memoize,
+            maxsize=maxsize,
+            policy=policy,
+            maxbytes=maxbytes,
+            ttl=ttl,
+            disk=disk,
+            shared=shared,
+            version=version,
+            readonly=readonly)
+
+    __cache = _Cache(
+        maxsize=maxsize,
+        policy=policy,
+        maxbytes=maxbytes,
+        ttl=ttl)
+
+    if readonly not in MEMOIZE_READONLY:
+        raise ValueError("unknown memoize readonly mode '{}'".format(readonly))
+
+    __origin = func.__qualname__ if readonly == 'debug' else None
+
+    __tiers = ()
+    if shared or disk is not None:
+        __name = '{}.{}'.format(func.__module__, func.__qualname__)
+        if version is None:
+            version = _code_version(func)
+        if shared:
+            __tiers += (_SharedTier('{}:{}'.format(__name, version)),)
+        if disk is not None:
+            __disk = _DiskStore(disk, __name, version)
+            __tiers += (__disk,)
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def __memoized(*args, **kwargs):
+            __key = _make_key(args, kwargs)
+            __value = __cache.get(__key)
+            if __value is _MISSING:
+                __value = await _single_flight_async(
+                    __cache,
+                    __key,
+                    functools.partial(func, *args, **kwargs)
+                    if not __tiers else functools.partial(
+                        _call_through_async,
+                        __tiers, __key, func, args, kwargs))
+            if readonly:
+                __value = _readonly_result(__value, __origin)
+            return __value
+    else:
+        @functools.wraps(func)
+        def __memoized(*args, **kwargs):
+            __key = _make_key(args, kwargs)
+            __value = __cache.get(__key)
+            if __value is _MISSING:
+                __value = _single_flight(
+                    __cache,
+                    __key,
+                    functools.partial(func, *args, **kwargs)
+                    if not __tiers else functools.partial(
+                        _call_through,
+                        __tiers, __key, func, args, kwargs))
+            if readonly:
+                __value = _readonly_result(__value, __origin)
+            return __value
+
+    __memoized.cache_info = __cache.info
+    __memoized.cache_clear = __cache.clear
+    # for parallel_map
+    __memoized._cache = __cache
+    __memoized._present = (
+        functools.partial(_readonly_result, origin=__origin)
+        if readonly else None)
+    if disk is not None:
+        __memoized.disk_clear = __disk.clear
+
+    return __memoized
+
+def memoize_method(
+        func=None,
+        *,
+        maxsize=None,
+        policy='lru',
+        maxbytes=None,
+        ttl=None,
+        readonly=False):
+    """
+    Method decorator. Caches the results of the decorated method, in a
+    separate cache for each instance, keyed by the other arguments.
+
+    Unlike memoize, the instances are neither hashed nor stringified :
+    the caches are indexed by identity, and freed with their instance.
+    The instances must support weak references.
+
+    The results must not hold a reference to their instance, which would
+    then never be freed.
+
+    Parameters
+    ----------
+    func: callable.
+        The method to memoize.
+    maxsize: int.
+        The maximum number of cached results, per instance.
+    policy: str.
+        Which entry to evict when a cache is full, 'lru' or 'lfu'.
+    maxbytes: int.
+        The maximum estimated size of the cached results, per instance.
+    ttl: float.
+        The lifetime of the cached results, in seconds.
+    readonly: bool or str.
+        Whether to protect the arrays in the results, as in memoize.
+
+    Returns
+    -------
+    out: callable.
+        The decorated method, with the functions:
+        - cache_info(instance): the statistics of the cache of instance.
+        - cache_clear(instance): empties the cache of instance.
+    """
+    if func is None:
+        return functools.partial(
+            memoize_method,
+            maxsize=maxsize,
+            policy=policy,
+            maxbytes=maxbytes,
+            ttl=ttl,
+            readonly=readonly)
+
+    if policy not in MEMOIZE_POLICIES:
+        raise ValueError("unknown memoize policy '{}'".format(policy))
+    if readonly not in MEMOIZE_READONLY:
+        raise ValueError("unknown memoize readonly mode '{}'".format(readonly))
+
+    __origin = func.__qualname__ if readonly == 'debug' else None
+
+    __caches = {}   # id(instance) => (weak reference, cache)
+    __lock = threading.Lock()
+
+    def __cache_of(instance):
+        __entry = __caches.get(id(instance), None)
+        if __entry is not None:
+            return __entry[1]
+
+        with __lock:
+            __entry = __caches.get(id(instance), None)
+            if __entry is None:
+                __id = id(instance)
+                try:
+                    __reference = weakref.ref(
+                        instance,
+                        lambda __ref: __caches.pop(__id, None))
+                except TypeError:
+                    raise TypeError(
+                        "memoize_method requires weak references to {} "
+                        "instances".format(type(instance).__name__))
+                __entry = __caches[__id] = (
+                    __reference,
+                    _Cache(
+                        maxsize=maxsize,
+                        policy=policy,
+                        maxbytes=maxbytes,
+                        ttl=ttl,
+                        stripes=1))
+            return __entry[1]
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def __memoized(self, *args, **kwargs):
+            __cache = __cache_of(self)
+            __key = _make_key(args, kwargs)
+            __value = __cache.get(__key)
+            if __value is _MISSING:
+                __value = await _single_flight_async(
+                    __cache,
+                    __key,
+                    functools.partial(func, self, *args, **kwargs))
+            if readonly:
+                __value = _readonly_result(__value, __origin)
+            return __value
+    else:
+        @functools.wraps(func)
+        def __memoized(self, *args, **kwargs):
+            __cache = __cache_of(self)
+            __key = _make_key(args, kwargs)
+            __value = __cache.get(__key)
+            if __value is _MISSING:
+                __value = _single_flight(
+                    __cache,
+                    __key,
+                    functools.partial(func, self, *args, **kwargs))
+            if readonly:
+                __value = _readonly_result(__value, __origin)
+            return __value
+
+    __memoized.cache_info = lambda instance: __cache_of(instance).info()
+    __memoized.cache_clear = lambda instance: __cache_of(instance).clear()
+
+    return __memoized
+
+#####################################################################
+# PARALLEL MAPPING
+#####################################################################
+
+def parallel_map(
+        func: callable,
+        iterable: object,
+        workers: int = None,
+        processes: bool = False,
+        buffersize: int = None):
+    """
+    Maps a function over an iterable with a pool of workers, computing
+    each distinct input once.
+
+    The inputs are deduplicated by their memoize key : the duplicates
+    awaiting the same computation share it. When func is memoized, its
+    cache is consulted before submitting any work, and filled with the
+    results ; so the duplicates are computed once overall, within the
+    limits of the cache.
+
+    The results are yielded in the order of the inputs. The iterable is
+    consumed lazily, and at most buffersize inputs are pending at any
+    time : the memory stays flat on huge iterables.
+
+    Parameters
+    ----------
+    func: callable.
+        The function to map, of a single argument ; it must be picklable
+        for a process pool.
+    iterable: iterable.
+        The inputs.
+    workers: int.
+        The number of workers ; by default, the executor decides.
+    processes: bool.
+        Whether to use a pool of processes rather than threads.
+    buffersize: int.
+        The maximum number of pending inputs ; 4 per worker by default.
+
+    Returns
+    -------
+    out: generator.
+        The results, in the order of the inputs.
+    """
+    if inspect.iscoroutinefunction(func):
+        raise TypeError("parallel_map can't run coroutine functions")
+
+    __cache = getattr(func, '_cache', None)
+    __present = getattr(func, '_present', None)
+    if buffersize is None:
+        buffersize = 4 * (workers or os.cpu_count() or 1)
+    if buffersize < 1:
+        raise ValueError(
+            "the buffer size must be positive, got {}".format(buffersize))
+
+    # the arguments are checked on the call, the work starts on iteration
+    def __results():
+        __executor = (
+            concurrent.futures.ProcessPoolExecutor if processes
+            else concurrent.futures.ThreadPoolExecutor)(max_workers=workers)
+        __items = iter(iterable)
+        __window = collections.deque()  # (key, flight, value), in input order
+        __pending = {}  # key => flight : [future, number of inputs, stored]
+
+        try:
+            while True:
+                while len(__window) < buffersize:
+                    __item = next(__items, _MISSING)
+                    if __item is _MISSING:
+                        break
+
+                    __key = _make_key((__item,), {})
+                    if __cache is not None:
+                        # in a thread pool, the memoized function records the
+                        # misses itself
+                        __value = __cache.get(
+                            __key,
+                            record=True if processes else 'hits')
+                        if __value is not _MISSING:
+                            if __present is not None:
+                                __value = __present(__value)
+                            __window.append((__key, None, __value))
+                            continue
+
+                    __flight = __pending.get(__key, None)
+                    if __flight is None:
+                        __flight = __pending[__key] = [
+                            __executor.submit(func, __item), 0, False]
+                    __flight[1] += 1
+                    __window.append((__key, __flight, None))
+
+                if not __window:
+                    return
+
+                __key, __flight, __value = __window.popleft()
+                if __flight is not None:
+                    __value = __flight[0].result()
+                    __flight[1] -= 1
+                    if not __flight[1]:
+                        del __pending[__key]
+
+                    # the worker processes fill their own caches
+                    if processes and __cache is not None:
+                        if not __flight[2]:
+                            __cache.put(__key, __value)
+                            __flight[2] = True
+                        if __present is not None:
+                            __value = __present(__value)
+
+                yield __value
+        finally:
+            __executor.shutdown(wait=True, cancel_futures=True)
 
-    key = str(args) + str(kwargs)
-    if key not in func.__cache__:
-        func.__cache__[key] = func(*args, **kwargs)
-    
-    return func.__cache__[key]
\ No newline at end of file
+    return __results()
@@ -4,9 +4,12 @@
 """Tests the type checking predicates."""
 
 import numpy as np
+import tracemalloc
 
 import pytest
+from decorator import decorator
 from numpy.testing import assert_allclose
+from timeit import timeit
 
 import practical.arrays as arrays
 
@@ -66,3 +69,404 @@ def test_dict_to_array_conversion():
 
     for i, k in enumerate(sorted(keys_3)):
         assert array_4[i] == data.get(k, 0.0)
+
+def test_dict_to_array_dtype_and_buffer():
+    data = {'a': 1, 'b': 2.5}
+    keys = ['a', 'b', 'c']
+
+    array = arrays.convert_dict_to_array(data, keys, dtype=np.float32)
+    assert array.dtype == np.float32
+    assert array.tolist() == [1.0, 2.5, 0.0]
+
+    integers = arrays.convert_dict_to_array({'a': 1}, keys, dtype=np.int64)
+    assert integers.dtype == np.int64 and integers.tolist() == [1, 0, 0]
+
+    # a reusable buffer
+    buffer = np.empty(3)
+    for i in range(3):
+        result = arrays.convert_dict_to_array({'c': i}, keys, default=-1, out=buffer)
+        assert result is buffer
+        assert buffer.tolist() == [-1.0, -1.0, float(i)]
+
+    # the same, in place, with a schema
+    schema = arrays.KeySchema(keys, default=-1.0)
+    assert arrays.convert_dict_to_array({'b': 4}, schema, out=buffer) is buffer
+    assert buffer.tolist() == [-1.0, 4.0, -1.0]
+    assert schema.to_array({'b': 4}, dtype=np.int8).dtype == np.int8
+
+    # no silent object arrays
+    assert arrays.convert_dict_to_array({'a': 'x'}, keys).dtype.kind == 'U'
+    with pytest.raises(ValueError):
+        arrays.convert_dict_to_array({'a': 'x'}, keys, dtype=np.float64)
+
+    with pytest.raises(ValueError):
+        arrays.convert_dict_to_array(data, keys, out=np.empty(2))
+
+def test_dict_to_array_buffer_performance():
+    keys = ['k{}'.format(i) for i in range(200)]
+    schema = arrays.KeySchema(keys)
+    data = {k: 1.0 for k in keys[::3]}
+    buffer = np.empty(200)
+    scope = {
+        'arrays': arrays, 'np': np, 'keys': keys, 'schema': schema,
+        'data': data, 'buffer': buffer}
+
+    list_t = timeit(
+        "arrays.convert_dict_to_array(data, keys)",
+        number=1000,
+        globals=scope)
+    dtype_t = timeit(
+        "arrays.convert_dict_to_array(data, keys, dtype=np.float64)",
+        number=1000,
+        globals=scope)
+    buffer_t = timeit(
+        "arrays.convert_dict_to_array(data, schema, out=buffer)",
+        number=1000,
+        globals=scope)
+
+    print("200 keys: inferred {:.1f}us, dtype {:.1f}us, buffer {:.1f}us".format(
+        1000 * list_t,
+        1000 * dtype_t,
+        1000 * buffer_t))
+
+    # the buffers are filled in place, without a temporary of their size
+    large_keys = ['k{}'.format(i) for i in range(100000)]
+    large_data = {k: 1.0 for k in large_keys[::3]}
+    large_buffer = np.empty(len(large_keys))
+    for axes in (large_keys, arrays.KeySchema(large_keys)):
+        tracemalloc.start()
+        try:
+            arrays.convert_dict_to_array(large_data, axes, out=large_buffer)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        assert peak < large_buffer.nbytes / 10
+        assert large_buffer[:4].tolist() == [1.0, 0.0, 0.0, 1.0]
+        large_buffer[...] = np.nan
+
+def test_dicts_to_array_conversion():
+    keys = ['a', 'b', 'c', 'a']
+    records = [
+        {'a': 1.0, 'b': 2.0},
+        {'c': 3.0, 'z': 9.0},
+        {}]
+
+    expected = np.array([
+        [1.0, 2.0, -1.0, 1.0],
+        [-1.0, -1.0, 3.0, -1.0],
+        [-1.0, -1.0, -1.0, -1.0]])
+
+    matrix = arrays.convert_dicts_to_array(records, keys, default=-1.0)
+    assert_allclose(matrix, expected)
+
+    # without a length, the matrix is grown by blocks
+    streamed = arrays.convert_dicts_to_array(
+        (r for r in records * 3000),
+        keys,
+        default=-1.0)
+    assert streamed.shape == (9000, 4)
+    assert_allclose(streamed[-3:], expected)
+
+    assert arrays.convert_dicts_to_array([], keys).shape == (0, 4)
+    assert arrays.convert_dicts_to_array(
+        records, keys, dtype=np.int32).dtype == np.int32
+
+    for record in records:
+        assert_allclose(
+            arrays.convert_dicts_to_array([record], keys, default=-1.0)[0],
+            arrays.convert_dict_to_array(record, keys, default=-1.0))
+
+def test_dicts_to_array_streaming():
+    consumed = []
+
+    def records():
+        for i in range(10):
+            consumed.append(i)
+            yield {'x': i, 'y': -i}
+
+    blocks = arrays.stream_dicts_to_array(records(), ['y', 'x'], blocksize=4)
+    first = next(blocks)
+    assert first.shape == (4, 2)
+    assert len(consumed) == 4
+    assert [b.shape for b in blocks] == [(4, 2), (2, 2)]
+    assert first[:, 1].tolist() == [0, 1, 2, 3]
+
+    # the keys are read once, even from an iterator
+    matrix = arrays.convert_dicts_to_array(
+        (r for r in [{'a': 1.0}]),
+        iter(['a', 'b']))
+    assert matrix.tolist() == [[1.0, 0.0]]
+
+    for blocksize in (0, -1):
+        with pytest.raises(ValueError, match='block size'):
+            arrays.stream_dicts_to_array(records(), ['x'], blocksize)
+
+def test_dicts_to_array_performance():
+    keys = ['k{}'.format(i) for i in range(50)]
+    records = [
+        {k: float(i) for k in keys[i % 7::2]}
+        for i in range(2000)]
+    scope = {'arrays': arrays, 'np': np, 'keys': keys, 'records': records}
+
+    single_t = timeit(
+        "np.vstack([arrays.convert_dict_to_array(r, keys) for r in records])",
+        number=5,
+        globals=scope)
+    batch_t = timeit(
+        "arrays.convert_dicts_to_array(records, keys)",
+        number=5,
+        globals=scope)
+
+    print("2000 records: one by one {:.1f}ms, batch {:.1f}ms".format(
+        200 * single_t,
+        200 * batch_t))
+
+    assert batch_t < 0.75 * single_t
+
+#####################################################################
+# KEY SCHEMA
+#####################################################################
+
+def test_key_schema_round_trips():
+    schema = arrays.KeySchema(
+        ['x', 'y', 'z', 'x'],
+        default=-1.0,
+        defaults={'z': 0.5})
+
+    assert len(schema) == 4 and list(schema) == ['x', 'y', 'z', 'x']
+    assert schema.index('z') == 2 and schema.index('x') == 0
+    assert 'y' in schema and 'w' not in schema
+    assert schema.defaults.tolist() == [-1.0, -1.0, 0.5, -1.0]
+
+    array = schema.to_array({'x': 2.0, 'w': 9.0})
+    assert array.tolist() == [2.0, -1.0, 0.5, 2.0]
+    assert schema.to_dict(array) == {'x': 2.0, 'y': -1.0, 'z': 0.5}
+
+    records = [{'x': float(i), 'y': -float(i)} for i in range(5)]
+    matrix = schema.to_array_batch(records)
+    assert matrix.shape == (5, 4)
+    assert_allclose(matrix[:, 2], 0.5)
+    assert schema.to_dicts_batch(matrix) == [
+        dict(r, z=0.5) for r in records]
+
+    # in place of the keys
+    assert_allclose(
+        arrays.convert_dict_to_array({'y': 3.0}, keys=schema),
+        [-1.0, 3.0, 0.5, -1.0])
+    assert_allclose(
+        arrays.convert_dicts_to_array(records, keys=schema),
+        matrix)
+
+    with pytest.raises(ValueError):
+        schema.to_dict(np.zeros(3))
+
+    with pytest.raises(ValueError):
+        schema.to_dicts_batch(np.zeros(4))
+
+    with pytest.raises(ValueError):
+        arrays.KeySchema(['x'], defaults={'y': 1.0})
+
+    with pytest.raises(AttributeError):
+        schema.extra = 1
+
+def test_key_schema_performance():
+    keys = ['k{}'.format(i) for i in range(200)]
+    schema = arrays.KeySchema(keys)
+    data = {k: 1.0 for k in keys[::3]}
+    array = schema.to_array(data)
+    scope = {
+        'arrays': arrays, 'schema': schema, 'keys': keys,
+        'data': data, 'array': array}
+
+    keys_t = timeit(
+        "arrays.convert_dict_to_array(data, keys)", number=1000, globals=scope)
+    schema_t = timeit("schema.to_array(data)", number=1000, globals=scope)
+    inverse_t = timeit("schema.to_dict(array)", number=1000, globals=scope)
+
+    print("200 keys: list {:.1f}us, schema {:.1f}us, inverse {:.1f}us".format(
+        1000 * keys_t,
+        1000 * schema_t,
+        1000 * inverse_t))
+
+    assert schema_t < keys_t
+
+#####################################################################
+# SPARSE CONVERSION
+#####################################################################
+
+def test_dict_to_sparse_conversion():
+    keys = ['a', 'b', 'c', 'd', 'b']
+    data = {'d': 4.0, 'b': 2.0, 'z': 9.0}
+
+    indices, values = arrays.convert_dict_to_sparse(data, keys)
+    assert indices.tolist() == [1, 3, 4]
+    assert values.tolist() == [2.0, 4.0, 2.0]
+
+    dense = arrays.convert_dict_to_array(data, keys)
+    assert_allclose(dense[indices], values)
+    assert not np.delete(dense, indices).any()
+
+    schema = arrays.KeySchema(keys, dtype=np.float32)
+    indices, values = arrays.convert_dict_to_sparse(data, schema)
+    assert indices.tolist() == [1, 3, 4] and values.dtype == np.float32
+
+    with pytest.raises(ValueError):
+        arrays.convert_dict_to_sparse(data, arrays.KeySchema(keys, default=1.0))
+
+def test_sparse_batch():
+    keys = ['k{}'.format(i) for i in range(10)]
+    records = [
+        {'k3': 1.0, 'k1': 2.0},
+        {},
+        {'k9': -1.0, 'unknown': 5.0},
+        {'k0': 0.5, 'k3': 0.25, 'k9': 1.0}]
+
+    batch = arrays.convert_dicts_to_sparse(records, keys)
+    dense = arrays.convert_dicts_to_array(records, keys)
+
+    assert batch.shape == (4, 10) and len(batch) == 4 and batch.nnz == 6
+    assert batch.indptr.tolist() == [0, 2, 2, 3, 6]
+    assert batch.row(0)[0].tolist() == [1, 3]    # sorted
+    assert_allclose(batch.to_dense(), dense)
+    assert_allclose(batch.to_dense(out=np.ones((4, 10))), dense)
+
+    vector = np.arange(10.0)
+    assert_allclose(batch.dot(vector), dense @ vector)
+    assert_allclose(batch @ vector, dense @ vector)
+
+    empty = arrays.convert_dicts_to_sparse([], keys)
+    assert empty.shape == (0, 10)
+    assert empty.dot(vector).shape == (0,)
+
+    with pytest.raises(ValueError):
+        batch.dot(np.ones(9))
+
+    with pytest.raises(ValueError):
+        arrays.SparseBatch([0, 1], [10], [1.0], (1, 10))
+
+    with pytest.raises(ValueError):
+        batch.values[0] = 1.0
+
+def test_sparse_conversion_performance():
+    schema = arrays.KeySchema('k{}'.format(i) for i in range(100000))
+    records = [
+        {'k{}'.format((i * 7919 + j * 104729) % 100000): 1.0 for j in range(30)}
+        for i in range(100)]
+    scope = {'arrays': arrays, 'schema': schema, 'records': records}
+
+    dense_t = timeit(
+        "[arrays.convert_dict_to_array(r, schema) for r in records]",
+        number=1,
+        globals=scope)
+    sparse_t = timeit(
+        "[arrays.convert_dict_to_sparse(r, schema) for r in records]",
+        number=1,
+        globals=scope)
+    batch_t = timeit(
+        "arrays.convert_dicts_to_sparse(records, schema)",
+        number=1,
+        globals=scope)
+
+    print("100 records of 30 keys among 1e5: dense {:.1f}ms, "
+          "sparse {:.1f}ms, batch {:.1f}ms".format(
+            1000 * dense_t,
+            1000 * sparse_t,
+            1000 * batch_t))
+
+    # the sparse conversions don't allocate along the 1e5 keys : the whole
+    # batch takes less memory than a single dense row
+    row_nbytes = 100000 * 8
+    for statement in (
+            "[arrays.convert_dict_to_sparse(r, schema) for r in records]",
+            "arrays.convert_dicts_to_sparse(records, schema)"):
+        tracemalloc.start()
+        try:
+            exec(statement, scope)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        assert peak < row_nbytes / 2
+
+#####################################################################
+# SHAPE ENFORCING
+#####################################################################
+
+def legacy_reshape(*shapes):
+    """The original decorator, reshaping all the arguments on each call."""
+    def _reshape(arg, shape):
+        if shape and isinstance(arg, np.ndarray):
+            return np.reshape(arg, shape)
+        return arg
+
+    def caller(f, *args, **kwargs):
+        reshaped_args = [
+            _reshape(arg=arg, shape=shapes[i])
+            for i, arg in enumerate(args)]
+        if len(shapes) == len(args) + 1:
+            return _reshape(f(*reshaped_args, **kwargs), shapes[-1])
+        return f(*reshaped_args, **kwargs)
+
+    return decorator(caller)
+
+def scale_raw(x, factor, offset):
+    return factor * x + offset
+
+scale_legacy = legacy_reshape((3, 3), (), (), (9,))(scale_raw)
+scale_reshaped = arrays.reshape((3, 3), (), (), (9,))(scale_raw)
+
+def test_reshape_arguments():
+    @arrays.reshape((2, 3), (), x=(3, 2), returns=(-1,))
+    def combine(a, factor, x=None, *, returns=None):
+        return factor * a.T + (0 if x is None else x)
+
+    a = np.arange(6)
+    assert combine(a, 2).shape == (3, 2)
+    assert combine(a, 1, np.ones(6)).tolist() == [[1, 4], [2, 5], [3, 6]]
+    assert combine(a=a, factor=1, x=np.ones(6)).shape == (3, 2)
+    assert combine(a, 1, returns=np.zeros(3)).shape == (3, 2)
+
+    @arrays.reshape((2, 3), (), (-1,))
+    def transpose(a, label):
+        return a.T
+
+    assert transpose(np.arange(6), 'a').tolist() == [0, 3, 1, 4, 2, 5]
+    assert transpose(label='a', a=np.arange(6)).shape == (6,)
+
+    @arrays.reshape((3, 1))
+    def identity(v):
+        return v
+
+    assert identity([0, 1, 2]) == [0, 1, 2]     # not an array
+
+    # the arrays with the right shape are passed as they are
+    b = np.zeros((3, 1))
+    assert identity(b) is b
+    assert identity(b.ravel()).base is b
+
+    # nothing to reshape, nothing to wrap
+    assert arrays.reshape((), ())(scale_raw) is scale_raw
+
+    with pytest.raises(ValueError):
+        arrays.reshape((), (), (), (), ())(scale_raw)
+
+    with pytest.raises(ValueError):
+        arrays.reshape(y=(2,))(scale_raw)
+
+def test_reshape_overhead():
+    x = np.arange(9.0).reshape(3, 3)
+    scope = {
+        'x': x,
+        'scale_raw': scale_raw,
+        'scale_legacy': scale_legacy,
+        'scale_reshaped': scale_reshaped}
+
+    raw_t = timeit("scale_raw(x, 2.0, 1.0)", number=10000, globals=scope)
+    legacy_t = timeit("scale_legacy(x, 2.0, 1.0)", number=10000, globals=scope)
+    reshaped_t = timeit("scale_reshaped(x, 2.0, 1.0)", number=10000, globals=scope)
+
+    print("reshape overhead: legacy {:.2f}us, compiled {:.2f}us".format(
+        100 * (legacy_t - raw_t),
+        100 * (reshaped_t - raw_t)))
+
+    assert scale_reshaped(x.ravel(), 2.0, 1.0).shape == (9,)
+    assert reshaped_t - raw_t < 0.5 * (legacy_t - raw_t)
@@ -3,13 +3,31 @@
 
 """Tests the type checking predicates."""
 
+import asyncio
+import gc
+import itertools
 import numpy as np
+import os
+import sympy as smp
+import threading
+import time
+import weakref
 
 import pytest
 from numpy.testing import assert_allclose
+from concurrent.futures import ThreadPoolExecutor
 from timeit import timeit
 
-from practical.memory import memoize
+from practical.memory import (
+    CacheInfo,
+    SharedCacheServer,
+    _make_key,
+    connect_shared_cache,
+    memoize,
+    memoize_method,
+    parallel_map,
+    register_key_builder,
+    set_memoize_budget)
 
 #####################################################################
 # MEMOIZATION
@@ -34,5 +52,774 @@ def test_memoize_performance():
 
     print(mem_t, raw_t)
 
-def memoize_identity():
+def test_memoize_identity():
     assert f1_raw() == f1_mem()
+    assert f1_mem.cache_info().currsize == 1
+
+def test_bounded_lru_memoize():
+    calls = []
+
+    @memoize(maxsize=2)
+    def square(x):
+        calls.append(x)
+        return x * x
+
+    assert [square(x) for x in (1, 2, 1, 3, 1, 2)] == [1, 4, 1, 9, 1, 4]
+    assert calls == [1, 2, 3, 2]    # 2 was the least recently used
+    assert square.cache_info() == CacheInfo(2, 4, 2, 2, 2, 0)
+
+    square.cache_clear()
+    assert square.cache_info() == CacheInfo(0, 0, 0, 2, 0, 0)
+
+def test_bounded_lfu_memoize():
+    calls = []
+
+    @memoize(maxsize=2, policy='lfu')
+    def square(x):
+        calls.append(x)
+        return x * x
+
+    for x in (1, 1, 1, 2, 3, 1, 2, 3):
+        square(x)
+
+    assert calls == [1, 2, 3, 2, 3]    # 1 is never evicted
+    assert square.cache_info().evictions == 3
+    assert square.cache_info().currsize == 2
+
+    with pytest.raises(ValueError):
+        memoize(policy='fifo')(lambda x: x)
+
+def test_lfu_memoize_admits_new_keys():
+    calls = []
+
+    @memoize(maxsize=2, policy='lfu')
+    def square(x):
+        calls.append(x)
+        return x * x
+
+    # the residents are used twice when 3 comes : it takes the place of
+    # the least recent of them, and stays
+    for x in (1, 1, 2, 2, 3, 3, 3, 3):
+        square(x)
+
+    assert calls == [1, 2, 3]
+    assert square.cache_info().evictions == 1
+
+def test_memoize_none_results():
+    calls = []
+
+    @memoize
+    def nothing(x):
+        calls.append(x)
+
+    nothing(1)
+    nothing(1)
+    assert calls == [1]
+
+def test_memoize_byte_budget():
+    @memoize(maxbytes=3 * 8000 + 1000)
+    def zeros(n):
+        return np.zeros(n)
+
+    for n in range(1000, 1010):
+        zeros(n)
+
+    info = zeros.cache_info()
+    assert info.currsize == 3
+    assert info.evictions == 7
+    assert 3 * 8000 < info.currbytes <= 3 * 8000 + 1000
+
+    zeros(100000)   # larger than the whole budget : not cached
+    assert zeros.cache_info().currsize == 3
+
+def test_memoize_ttl():
+    calls = []
+
+    @memoize(ttl=0.05)
+    def now(x):
+        calls.append(x)
+        return x
+
+    now(1)
+    now(1)
+    assert len(calls) == 1
+
+    time.sleep(0.06)
+    now(1)
+    assert len(calls) == 2
+    assert now.cache_info().evictions == 1
+
+def test_memoize_ttl_drops_expired_entries():
+    @memoize(ttl=0.05)
+    def identity(x):
+        return x
+
+    for x in range(1000):
+        identity(x)
+    assert identity.cache_info().currsize == 1000
+
+    time.sleep(0.06)
+    identity(-1)    # expired entries go on the next insertion
+    assert identity.cache_info().currsize == 1
+    assert identity.cache_info().evictions == 1000
+
+def test_process_wide_memoize_budget():
+    @memoize
+    def ones(n):
+        return np.ones(n)
+
+    @memoize
+    def zeros(n):
+        return np.zeros(n)
+
+    set_memoize_budget(100000)
+    try:
+        for n in range(5000, 5010):
+            ones(n)
+            zeros(n)
+
+        total = ones.cache_info().currbytes + zeros.cache_info().currbytes
+        assert total <= 100000
+        assert ones.cache_info().evictions > 0
+        assert zeros.cache_info().evictions > 0
+    finally:
+        set_memoize_budget(None)
+
+#####################################################################
+# CONCURRENCY
+#####################################################################
+
+def test_single_flight_memoize():
+    calls = []
+
+    @memoize
+    def slow_square(x):
+        calls.append(x)
+        time.sleep(0.1)
+        return x * x
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(slow_square, 8 * [3]))
+
+    assert results == 8 * [9]
+    assert calls == [3]
+
+def test_single_flight_errors_are_shared_and_not_cached():
+    calls = []
+
+    @memoize
+    def fail(x):
+        calls.append(x)
+        time.sleep(0.1)
+        raise KeyError(x)
+
+    def call(x):
+        try:
+            fail(x)
+        except KeyError as error:
+            return error
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        errors = list(pool.map(call, 4 * ['a']))
+
+    assert all(isinstance(e, KeyError) for e in errors)
+    assert calls == ['a']
+
+    call('a')
+    assert calls == ['a', 'a']
+
+def test_unrelated_keys_dont_wait_for_each_other():
+    # all the calls must be running together to get past the barrier ;
+    # it breaks if they are serialized
+    barrier = threading.Barrier(4)
+
+    @memoize
+    def meeting_identity(x):
+        barrier.wait(timeout=10)
+        return x
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        assert list(pool.map(meeting_identity, range(4))) == list(range(4))
+
+    assert meeting_identity.cache_info().misses == 4
+
+def test_memoize_recursion():
+    @memoize
+    def fibonacci(n):
+        return n if n < 2 else fibonacci(n - 1) + fibonacci(n - 2)
+
+    assert fibonacci(100) == 354224848179261915075
+
+def test_async_memoize():
+    calls = []
+
+    @memoize(maxsize=2)
+    async def fetch(x):
+        calls.append(x)
+        await asyncio.sleep(0.05)
+        return 2 * x
+
+    async def main():
+        first = await asyncio.gather(*[fetch(1) for i in range(5)])
+        second = await fetch(1)
+        return first, second
+
+    assert asyncio.run(main()) == ([2, 2, 2, 2, 2], 2)
+    assert calls == [1]
+    assert fetch.cache_info().hits == 1
+
+def test_async_memoize_errors():
+    calls = []
+
+    @memoize
+    async def fail(x):
+        calls.append(x)
+        await asyncio.sleep(0.05)
+        raise KeyError(x)
+
+    async def main():
+        return await asyncio.gather(
+            *[fail('a') for i in range(3)],
+            return_exceptions=True)
+
+    assert all(isinstance(e, KeyError) for e in asyncio.run(main()))
+    assert calls == ['a']
+
+    asyncio.run(main())
+    assert calls == ['a', 'a']
+
+def test_async_memoize_cancellation():
+    calls = []
+
+    @memoize
+    async def fetch(x):
+        calls.append(x)
+        await asyncio.sleep(0.1)
+        return x
+
+    async def cancel_one():
+        first = asyncio.ensure_future(fetch(1))
+        second = asyncio.ensure_future(fetch(1))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second, first.cancelled()
+
+    assert asyncio.run(cancel_one()) == (1, True)
+    assert calls == [1]
+
+    async def cancel_all():
+        only = asyncio.ensure_future(fetch(2))
+        await asyncio.sleep(0.01)
+        only.cancel()
+        await asyncio.sleep(0.15)
+        return only.cancelled()
+
+    assert asyncio.run(cancel_all())
+    assert fetch.cache_info().currsize == 1     # 2 was never cached
+
+    async def cancel_and_retry():
+        first = asyncio.ensure_future(fetch(3))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.sleep(0)
+        # the cancelled task may not be done yet : not joined anyway
+        return await fetch(3), first.cancelled()
+
+    assert asyncio.run(cancel_and_retry()) == (3, True)
+    assert calls == [1, 2, 3, 3]
+
+#####################################################################
+# READ-ONLY RESULTS
+#####################################################################
+
+def test_readonly_memoize_is_zero_copy():
+    @memoize(readonly=True)
+    def grid(n):
+        return np.zeros((n, n)), np.ones(n)
+
+    first, ones = grid(100)
+    second, ones = grid(100)
+
+    assert first is not second
+    assert np.shares_memory(first, second)
+    assert not first.flags.writeable
+    with pytest.raises(ValueError):
+        first[0, 0] = 1.0
+    with pytest.raises(ValueError):
+        second.flags.writeable = True
+
+    second.shape = (10000,)     # only changes this view
+    assert grid(100)[0].shape == (100, 100)
+
+def test_readonly_memoize_debug_mode():
+    @memoize(readonly='debug')
+    def grid(n):
+        return np.zeros((n, n))
+
+    cached = grid(10)
+    with pytest.raises(ValueError, match='grid'):
+        cached[0] = 1.0
+    with pytest.raises(ValueError, match='grid'):
+        cached[2:] += 1.0
+    with pytest.raises(ValueError, match='grid'):
+        np.add(cached, 1.0, out=cached)
+
+    # the computations and the copies are plain, writeable arrays
+    result = cached + 1.0
+    copy = cached.copy()
+    copy[0] = 1.0
+    assert type(result) is np.ndarray and type(copy) is np.ndarray
+    assert type(cached.sum()) is np.float64
+    assert not grid(10).any()
+
+#####################################################################
+# METHODS
+#####################################################################
+
+class Polynomial(object):
+    def __init__(self, *coefficients):
+        self.coefficients = coefficients
+        self.calls = 0
+
+    def __repr__(self):
+        return 'Polynomial'     # the same for all the instances
+
+    __hash__ = None
+
+    @memoize_method(maxsize=8)
+    def evaluate(self, x):
+        self.calls += 1
+        return sum(c * x ** i for i, c in enumerate(self.coefficients))
+
+def test_memoize_method_caches_per_instance():
+    p = Polynomial(1, 2)
+    q = Polynomial(0, 0, 1)
+
+    assert p.evaluate(3) == 7
+    assert q.evaluate(3) == 9
+    assert p.evaluate(3) == 7
+    assert q.evaluate(x=3) == 9
+    assert (p.calls, q.calls) == (1, 2)
+    assert Polynomial.evaluate.cache_info(p) == CacheInfo(1, 1, 0, 8, 1, 0)
+
+    Polynomial.evaluate.cache_clear(p)
+    assert p.evaluate(3) == 7
+    assert p.calls == 2
+
+def test_memoize_method_frees_the_caches():
+    class Heavy(object):
+        @memoize_method
+        def ones(self, n):
+            return np.ones(n)
+
+    instances = [Heavy() for i in range(16)]
+    results = [weakref.ref(instance.ones(1000)) for instance in instances]
+    assert all(r() is not None for r in results)   # held by the caches
+
+    del instances
+    gc.collect()
+    assert all(r() is None for r in results)
+
+    @memoize_method
+    def method(self):
+        pass
+
+    class Slotted(object):
+        __slots__ = ()
+
+    with pytest.raises(TypeError):
+        method(Slotted())
+
+#####################################################################
+# CACHE KEYS
+#####################################################################
+
+def test_memoize_keys_on_large_arrays():
+    @memoize
+    def total(x):
+        return x.sum()
+
+    a = np.zeros(10000)
+    b = np.zeros(10000)
+    b[5000] = 1.0
+    assert str(a) == str(b)     # the repr elides the middle
+
+    assert total(a) == 0.0
+    assert total(b) == 1.0
+    assert total(b.reshape(100, 100)) == 1.0
+    assert total(b.astype(np.float32)) == 1.0
+    assert total.cache_info().misses == 4
+
+def test_memoize_keys_on_builtin_types():
+    x, y = smp.symbols('x y')
+
+    assert _make_key((1,), {}) != _make_key((1.0,), {})
+    assert _make_key((1,), {}) != _make_key((True,), {})
+    assert _make_key((), {'a': 1, 'b': 2}) == _make_key((), {'b': 2, 'a': 1})
+    assert _make_key(({'a': [1], 'b': 2},), {}) == _make_key(({'b': 2, 'a': [1]},), {})
+    assert _make_key((x + y,), {}) == _make_key((y + x,), {})
+    assert _make_key((x + y,), {}) != _make_key((x * y,), {})
+
+    # the nested values keep their type
+    assert len(set(_make_key(([v],), {}) for v in (1, 1.0, True))) == 3
+    assert _make_key(((1,),), {}) != _make_key(((1.0,),), {})
+    assert _make_key(({'a': 1},), {}) != _make_key(({'a': 1.0},), {})
+    assert _make_key(({1, 2},), {}) != _make_key(({1.0, 2},), {})
+
+def test_memoize_keys_on_nested_arrays():
+    a = np.zeros(2000)
+    b = np.zeros(2000)
+    b[1000] = 1.0
+    assert str((a,)) == str((b,))   # the repr elides the middle
+
+    assert _make_key(((a,),), {}) != _make_key(((b,),), {})
+    assert _make_key(((a, 1),), {}) == _make_key(((a.copy(), 1),), {})
+    assert _make_key(([a],), {}) != _make_key(([b],), {})
+    assert _make_key(({'x': a},), {}) != _make_key(({'x': b},), {})
+
+def test_custom_key_builder():
+    class Point(object):
+        def __init__(self, x, y):
+            self.x, self.y = x, y
+
+        __hash__ = None
+
+    register_key_builder(Point, lambda p: (Point, p.x, p.y))
+
+    @memoize
+    def norm(p):
+        return (p.x ** 2 + p.y ** 2) ** 0.5
+
+    assert norm(Point(3, 4)) == 5.0
+    assert norm(Point(3, 4)) == 5.0
+    assert norm(Point(6, 8)) == 10.0
+    assert norm.cache_info().hits == 1
+
+def test_key_building_performance():
+    large = np.random.rand(128, 1024)   # 1 MB
+    scope = {'large': large, '_make_key': _make_key}
+
+    str_t = timeit("str((large,)) + str({})", number=100, globals=scope)
+    key_t = timeit("_make_key((large,), {})", number=100, globals=scope)
+
+    print("key build on 1 MB array: repr {:.3f}ms, digest {:.3f}ms".format(
+        10 * str_t,
+        10 * key_t))
+
+    assert key_t < 1.0  # under 10 ms per key
+
+#####################################################################
+# PERSISTENCE
+#####################################################################
+
+def _disk_memoized(path, calls, version=None):
+    @memoize(disk=path, version=version)
+    def spread(x, scale=1.0, options=None):
+        calls.append(x)
+        return scale * np.arange(x, dtype=np.float64)
+
+    @memoize(disk=path, version=version)
+    def describe(x, options=None):
+        calls.append(x)
+        return {'x': x, 'options': options}
+
+    return spread, describe
+
+def _disk_worker(path, x):
+    calls = []
+    spread, describe = _disk_memoized(path, calls)
+    __spread = spread(x, scale=2.0)
+    __description = describe(x, options={'a': 1, 'b': 'c'})
+    return float(__spread.sum()), __description, len(calls)
+
+def test_disk_memoize_survives_restarts(tmp_path):
+    calls = []
+    spread, describe = _disk_memoized(tmp_path, calls)
+    assert spread(4).tolist() == [0.0, 1.0, 2.0, 3.0]
+    assert describe(4, options={'a': 1}) == {'x': 4, 'options': {'a': 1}}
+    assert calls == [4, 4]
+
+    # a fresh process, sharing the directory
+    calls = []
+    spread, describe = _disk_memoized(tmp_path, calls)
+    restored = spread(4)
+    assert restored.tolist() == [0.0, 1.0, 2.0, 3.0]
+    assert isinstance(restored, np.memmap)
+    assert not restored.flags.writeable
+    assert describe(4, options={'a': 1}) == {'x': 4, 'options': {'a': 1}}
+    assert describe(5) == {'x': 5, 'options': None}
+    assert calls == [5]
+    assert spread.cache_info().misses == 1   # the memory tier missed
+
+    spread.disk_clear()
+    spread.cache_clear()
+    spread(4)
+    assert calls == [5, 4]
+
+def test_disk_memoize_skips_identity_keys(tmp_path):
+    import sqlite3
+
+    class Opaque(object):
+        __hash__ = None     # keyed by its str, with its address
+
+    calls = []
+
+    @memoize(disk=tmp_path)
+    def name(x):
+        calls.append(x)
+        return type(x).__name__
+
+    assert name(object()) == 'object'
+    assert name(Opaque()) == 'Opaque'
+    assert name(len) == 'builtin_function_or_method'  # stable repr
+    assert len(calls) == 3
+
+    with sqlite3.connect(str(tmp_path / 'memoize.sqlite')) as connection:
+        rows = connection.execute('SELECT COUNT(*) FROM memoize').fetchone()
+    assert rows == (1,)     # only len could ever be read back
+
+def test_disk_memoize_versions(tmp_path):
+    calls = []
+    spread, describe = _disk_memoized(tmp_path, calls, version='1')
+    spread(3)
+    assert len(list((tmp_path / 'arrays').iterdir())) == 1
+
+    # the stale results are dropped when the code changes
+    spread, describe = _disk_memoized(tmp_path, calls, version='2')
+    spread(3)
+    assert calls == [3, 3]
+    assert len(list((tmp_path / 'arrays').iterdir())) == 1
+
+def test_disk_memoize_across_processes(tmp_path):
+    import multiprocessing
+
+    # the spawned workers hash the strings with other seeds
+    with multiprocessing.get_context('spawn').Pool(3) as pool:
+        results = pool.starmap(_disk_worker, [(tmp_path, 6)] * 3)
+        assert all(r[:2] == results[0][:2] for r in results)
+
+        assert pool.starmap(_disk_worker, [(tmp_path, 6)] * 3) == [
+            (30.0, {'x': 6, 'options': {'a': 1, 'b': 'c'}}, 0)] * 3
+
+    assert _disk_worker(tmp_path, 6)[2] == 0
+
+#####################################################################
+# SHARED CACHE
+#####################################################################
+
+@memoize(shared=True)
+def _shared_spread(x):
+    return np.full(10000, float(x))     # 80 kB, in shared memory
+
+@memoize(shared=True)
+def _shared_describe(x):
+    return {'x': x}
+
+def _shared_worker(x):
+    spread = _shared_spread(x)
+    return os.getpid(), float(spread[0]), spread.flags.writeable, _shared_describe(x)
+
+def test_shared_memoize_in_process():
+    _shared_spread.cache_clear()
+
+    with SharedCacheServer() as server:
+        connect_shared_cache(server.address, server.authkey)
+        try:
+            first = _shared_spread(1)
+            _shared_spread.cache_clear()    # drop the memory tier
+            second = _shared_spread(1)
+            _shared_spread.cache_clear()
+            third = _shared_spread(1)
+        finally:
+            connect_shared_cache(None)
+
+        assert first.flags.writeable
+        assert not second.flags.writeable
+        assert np.shares_memory(second, third)  # no copy
+        assert_allclose(second, first)
+        assert server.info()[os.getpid()] == (2, 1, 2 / 3)
+        assert len(server) == 1
+
+def test_shared_memoize_across_pool_workers():
+    import multiprocessing
+
+    _shared_spread.cache_clear()
+    _shared_describe.cache_clear()
+
+    with SharedCacheServer() as server:
+        connect_shared_cache(server.address, server.authkey)
+        try:
+            for x in range(4):
+                _shared_spread(x)
+                _shared_describe(x)
+        finally:
+            connect_shared_cache(None)
+
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(
+                2,
+                initializer=connect_shared_cache,
+                initargs=(server.address, server.authkey)) as pool:
+            results = pool.map(_shared_worker, list(range(4)) * 4, chunksize=1)
+
+        # the workers read all the results from the shared cache
+        assert [r[1:] for r in results] == [
+            (float(x), False, {'x': x}) for x in list(range(4)) * 4]
+        assert len(server) == 8
+
+        info = server.info()
+        assert info.pop(os.getpid()) == (0, 8, 0.0)
+        assert set(info) <= set(r[0] for r in results)
+        assert all(i.misses == 0 and i.hit_rate == 1.0 for i in info.values())
+        assert sum(i.hits for i in info.values()) >= 8
+
+def test_shared_mappings_live_with_the_arrays():
+    import gc
+    from practical import memory
+
+    _shared_spread.cache_clear()
+
+    with SharedCacheServer(maxsize=1) as server:
+        connect_shared_cache(server.address, server.authkey)
+        try:
+            _shared_spread(1)   # the creator doesn't keep the mapping
+            client = memory._shared_client()
+            assert len(client.segments) == 0
+
+            _shared_spread.cache_clear()
+            spread = _shared_spread(1)
+            assert len(client.segments) == 1
+
+            _shared_spread(2)   # evicts 1 from the server
+            _shared_spread.cache_clear()
+            assert_allclose(spread, 1.0)    # still mapped
+            del spread
+            gc.collect()
+            assert len(client.segments) == 0
+
+            # only the cache operations are served
+            with pytest.raises(RuntimeError, match='unknown operation'):
+                client.request('accept')
+            assert len(server) == 1
+        finally:
+            connect_shared_cache(None)
+
+def test_shared_memoize_without_server():
+    calls = []
+
+    @memoize(shared=True)
+    def spread(x):
+        calls.append(x)
+        return np.full(10000, float(x))
+
+    server = SharedCacheServer()
+    connect_shared_cache(server.address, server.authkey)
+    try:
+        spread(1)
+        servers = list(server._servers)
+        server.close()      # the clients are disconnected
+        spread.cache_clear()
+        assert_allclose(spread(1), 1.0)     # computed instead
+        assert_allclose(spread(2), 2.0)
+    finally:
+        connect_shared_cache(None)
+
+    assert calls == [1, 1, 2]
+    assert servers and not any(t.is_alive() for t in servers)
+
+def test_shared_cache_eviction():
+    _shared_spread.cache_clear()
+
+    with SharedCacheServer(maxsize=2) as server:
+        connect_shared_cache(server.address, server.authkey)
+        try:
+            first = _shared_spread(1)
+            _shared_spread(2)
+            _shared_spread.cache_clear()
+            _shared_spread(1)   # 2 is now the least recently used
+            _shared_spread(3)
+            assert len(server) == 2
+            _shared_spread.cache_clear()
+            _shared_spread(1)
+            _shared_spread(3)
+            _shared_spread(2)
+        finally:
+            connect_shared_cache(None)
+            _shared_spread.cache_clear()
+
+        assert server.info()[os.getpid()].hits == 3
+        assert_allclose(first, 1.0)
+
+#####################################################################
+# PARALLEL MAPPING
+#####################################################################
+
+@memoize
+def _slow_square(x):
+    time.sleep(0.001)
+    return x * x
+
+def test_parallel_map_deduplicates_the_inputs():
+    calls = []
+
+    @memoize
+    def square(x):
+        calls.append(x)
+        time.sleep(0.001)
+        return x * x
+
+    inputs = [i % 10 for i in range(1000)]
+    assert list(parallel_map(square, inputs, workers=4)) == [
+        x * x for x in inputs]
+    assert sorted(calls) == list(range(10))
+    assert square.cache_info().misses == 10
+    assert square.cache_info().hits > 900  # the others shared a pending call
+
+    # without a cache, only the pending duplicates are merged
+    calls = []
+
+    def cube(x):
+        calls.append(x)
+        return x ** 3
+
+    assert list(parallel_map(cube, [2] * 8 + [3] * 8, buffersize=8)) == (
+        [8] * 8 + [27] * 8)
+    assert calls == [2, 3]
+
+def test_parallel_map_streams_the_results():
+    consumed = []
+
+    def inputs():
+        for i in itertools.count():
+            consumed.append(i)
+            yield i
+
+    results = parallel_map(abs, inputs(), workers=2, buffersize=16)
+    assert list(itertools.islice(results, 100)) == list(range(100))
+    assert len(consumed) <= 100 + 16
+    results.close()
+
+    def fail(x):
+        if x == 3:
+            raise KeyError(x)
+        return x
+
+    results = parallel_map(fail, range(10))
+    assert next(results) == 0
+    with pytest.raises(KeyError):
+        list(results)
+
+    for buffersize in (0, -1):
+        with pytest.raises(ValueError, match='buffer size'):
+            parallel_map(abs, [-1, -2, -3], buffersize=buffersize)
+
+def test_parallel_map_with_processes():
+    _slow_square.cache_clear()
+
+    inputs = [i % 20 for i in range(400)]
+    results = parallel_map(_slow_square, inputs, workers=2, processes=True)
+    assert list(results) == [x * x for x in inputs]
+
+    # the results of the workers are cached in the parent
+    assert _slow_square.cache_info().currsize == 20
+    assert _slow_square.cache_info().misses == 20
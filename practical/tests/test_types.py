@@ -7,11 +7,287 @@ import math
 import numpy as np
 import sympy as smp
 
+import inspect
+import json
+import os
 import pytest
+import subprocess
+import sys
+import time
+from decorator import decorator
 from numpy.testing import assert_allclose
+from timeit import timeit
 
 import practical.types as types
 
+#####################################################################
+# TYPE ENFORCEMENT
+#####################################################################
+
+def legacy_check(arg, checker):
+    """The original check, dispatching on the checker at each call."""
+    if type(checker) == type:
+        return isinstance(arg, checker)
+    elif callable(checker):
+        return checker(arg)
+    else:
+        return True
+
+@decorator
+def legacy_typecheck(func, *args, **kwargs):
+    """The original decorator, introspecting the function on each call."""
+    __result = func(*args, **kwargs)
+    __arg_spec = inspect.getfullargspec(func)
+    for __argname, __arg in zip(__arg_spec.args, args):
+        if __argname in func.__annotations__:
+            assert legacy_check(__arg, func.__annotations__[__argname])
+    assert legacy_check(__result, func.__annotations__['return'])
+    return __result
+
+def increment_raw(x: int) -> int:
+    return x + 1
+
+@legacy_typecheck
+def increment_legacy(x: int) -> int:
+    return x + 1
+
+@types.typecheck
+def increment_checked(x: int) -> int:
+    return x + 1
+
+def test_typecheck_on_keywords_and_defaults():
+    @types.typecheck
+    def shift(x: int, offset: types.numeric = 1) -> int:
+        return x + offset
+
+    assert shift(1) == 2
+    assert shift(x=1, offset=3) == 4
+
+    with pytest.raises(TypeError):
+        shift(x=1.5)
+
+    with pytest.raises(TypeError):
+        shift(1, offset='dsf')
+
+    with pytest.raises(TypeError):
+        shift(1, 0.5)   # the result is a float
+
+def test_typecheck_on_invalid_default_values():
+    tested = []
+
+    def counted_int(x):
+        tested.append(x)
+        return isinstance(x, int)
+
+    @types.typecheck
+    def describe(x: int = None, *, y: float = None) -> str:
+        return '{} {}'.format(x, y)
+
+    @types.typecheck(precall=True)
+    def describe_before(x: counted_int = 0, *, y: float = None) -> str:
+        return '{} {}'.format(x, y)
+
+    with pytest.raises(TypeError, match='x='):
+        describe()
+
+    with pytest.raises(TypeError, match='y='):
+        describe(1)
+
+    assert describe(1, y=1.5) == '1 1.5'
+
+    assert tested == [0]    # the valid default is tested when decorating
+    with pytest.raises(TypeError, match='y='):
+        describe_before()
+    assert describe_before(y=1.5) == '0 1.5'
+    assert tested == [0]
+
+def test_typecheck_on_decorated_functions():
+    from practical.arrays import reshape
+    from practical.memory import memoize
+
+    @types.typecheck
+    @memoize
+    def double(x: int) -> int:
+        return 2 * x
+
+    @types.typecheck
+    @reshape((2, 2))
+    def trace(m: np.ndarray, scale: types.numeric = 1) -> float:
+        return float(scale * np.trace(m))
+
+    @types.typecheck
+    @types.typecheck
+    def increment(x: int) -> int:
+        return x + 1
+
+    assert double(2) == 4
+    assert trace(np.arange(4), scale=2) == 6.0
+    assert increment(1) == 2
+
+    with pytest.raises(TypeError, match='accepts'):
+        double("a")
+
+    with pytest.raises(TypeError, match='accepts'):
+        trace([[1, 0], [0, 1]])
+
+    with pytest.raises(TypeError, match='accepts'):
+        increment(1.5)
+
+def test_typecheck_on_keyword_only_and_extra_args():
+    @types.typecheck
+    def total(*values: types.numeric, scale: int = 1, **weights: float):
+        return scale * sum(values) + sum(weights.values())
+
+    assert total(1, 2.5, scale=2, a=0.5) == 7.5
+
+    with pytest.raises(TypeError):
+        total(1, 'a')
+
+    with pytest.raises(TypeError):
+        total(1, scale=2.0)
+
+    with pytest.raises(TypeError):
+        total(1, a=1)
+
+def test_typecheck_before_the_call():
+    calls = []
+
+    @types.typecheck(precall=True)
+    def expensive(x: types.finite, *, y: types.finite = 1.0) -> float:
+        calls.append(x)
+        return x * y
+
+    assert expensive(2.0, y=3.0) == 6.0
+    assert len(calls) == 1
+
+    with pytest.raises(TypeError):
+        expensive(np.inf)
+
+    with pytest.raises(TypeError):
+        expensive(1.0, y=np.nan)
+
+    assert len(calls) == 1  # never ran on invalid inputs
+
+    with pytest.raises(TypeError):
+        expensive(2, y=3)   # the result is an int
+
+    assert len(calls) == 2
+
+def test_typecheck_off_mode():
+    def identity(x: int) -> int:
+        return x
+
+    assert types.typecheck(mode='off')(identity) is identity
+    assert types.typecheck(identity) is not identity
+
+    types.set_typecheck_mode('off', module=__name__)
+    try:
+        assert types.get_typecheck_mode(__name__ + '.sub')[0] == 'off'
+        assert types.typecheck(identity) is identity
+    finally:
+        types.set_typecheck_mode('on', module=__name__)
+
+def test_typecheck_sampled_mode():
+    @types.typecheck(mode='sampled', rate=10)
+    def identity(x: int) -> int:
+        return x
+
+    for i in range(100):
+        identity('not checked' if i % 10 else i)
+
+    assert identity.typecheck_info() == types.TypecheckInfo('sampled', 10, 90)
+
+    with pytest.raises(TypeError):
+        identity('checked')
+
+def test_typecheck_time_budget(monkeypatch):
+    # a fake clock, advanced by the checks and the calls only
+    clock = [0.0]
+    monkeypatch.setattr(time, 'perf_counter', lambda: clock[0])
+
+    def costly_int(x):
+        clock[0] += 1.0
+        return isinstance(x, int)
+
+    # a check costs as much as a call : a quarter of the calls are
+    # checked, so that a fifth of the time is spent checking
+    @types.typecheck(mode='sampled', budget=0.2)
+    def identity(x: costly_int) -> int:
+        clock[0] += 1.0
+        return x
+
+    for i in range(1000):
+        identity(i)
+
+    info = identity.typecheck_info()
+    assert info.checked + info.skipped == 1000
+    assert 240 <= info.checked <= 260
+
+    # only the checks count against the budget, not the function body
+    @types.typecheck(mode='sampled', budget=0.01)
+    def slow(x: int) -> int:
+        clock[0] += 1.0
+        return x
+
+    for i in range(100):
+        slow(i)
+
+    assert slow.typecheck_info().checked == 100
+
+def test_typecheck_mode_from_environment():
+    script = (
+        "import practical.types as t;"
+        "print(hasattr(t.numeric, '__wrapped__'),"
+        " hasattr(t.bounds, '__wrapped__'),"
+        " hasattr(t.scalar, 'typecheck_info'))")
+    env = dict(os.environ, PRACTICAL_TYPECHECK='sampled:5,practical.types=off')
+    out = subprocess.check_output([sys.executable, '-c', script], env=env)
+    assert out.split() == [b'False', b'False', b'False']
+
+    env['PRACTICAL_TYPECHECK'] = 'sampled:5'
+    out = subprocess.check_output([sys.executable, '-c', script], env=env)
+    assert out.split() == [b'True', b'True', b'True']
+
+def test_typecheck_instrumentation():
+    @types.typecheck(instrument=True, precall=True)
+    def halve(x: types.finite) -> int:
+        return x // 2
+
+    for i in range(10):
+        halve(2 * i)
+
+    with pytest.raises(TypeError):
+        halve(np.nan)
+
+    with pytest.raises(TypeError):
+        halve(1.0)
+
+    name = __name__ + '.test_typecheck_instrumentation.<locals>.halve'
+    stats = types.typecheck_snapshot()[name]
+
+    assert stats['calls'] == 12
+    assert stats['failures'] == {'arguments': 1, 'returns': 1}
+    assert stats['time']['body']['total'] > 0
+    assert 0 < stats['time']['arguments']['p50'] <= stats['time']['arguments']['p99']
+
+    assert name in types.typecheck_report()
+    assert json.loads(types.typecheck_report(format='json'))[name]['calls'] == 12
+
+    types.reset_typecheck_instruments()
+    assert types.typecheck_snapshot()[name]['calls'] == 0
+
+def test_typecheck_overhead():
+    raw_t = timeit("increment_raw(1)", number=100000, globals=globals())
+    legacy_t = timeit("increment_legacy(1)", number=100000, globals=globals())
+    checked_t = timeit("increment_checked(1)", number=100000, globals=globals())
+
+    print(
+        "per call overhead: legacy {:.3f}us, compiled {:.3f}us".format(
+            10 * (legacy_t - raw_t),
+            10 * (checked_t - raw_t)))
+
+    assert checked_t - raw_t < 0.5 * (legacy_t - raw_t)
+
 #####################################################################
 # GENERIC PREDICATES
 #####################################################################
@@ -170,6 +446,50 @@ def test_all_of():
         types.finite)(
             1.5)
 
+def test_combinators_short_circuit():
+    calls = []
+
+    def spy(x):
+        calls.append(x)
+        return True
+
+    assert types.one_of(types.numeric, spy)(3)
+    assert types.one_of(int, str, spy)('a')
+    assert not types.all_of(types.nothing, spy)(3)
+    assert calls == []
+
+    assert types.one_of(types.nothing, spy)(3)
+    assert types.all_of(float, spy)(1.5)
+    assert calls == [3, 1.5]
+
+def test_adaptive_combinators():
+    calls = []
+
+    def miss(x):
+        calls.append('miss')
+        return False
+
+    def hit(x):
+        calls.append('hit')
+        return True
+
+    any_of = types.one_of(miss, hit, adaptive=True)
+    for i in range(1000):
+        assert any_of(i)
+
+    # after the first reordering, the satisfied checker comes first
+    assert calls.count('miss') < 500
+    assert calls.count('hit') == 1000
+
+    del calls[:]
+    every = types.all_of(hit, miss, adaptive=True)
+    for i in range(1000):
+        assert not every(i)
+
+    # and the failing one for all_of
+    assert calls.count('hit') < 500
+    assert calls.count('miss') == 1000
+
 def test_iterable():
     bullshit = [
         list,
@@ -194,6 +514,62 @@ def test_iterable():
     for x in ok:
         assert types.iterable(x)
 
+#####################################################################
+# RESULT CACHING
+#####################################################################
+
+def test_cached_predicate():
+    calls = []
+
+    def spy(x):
+        calls.append(x)
+        return types.bounds(x)
+
+    check = types.cached(spy, maxsize=2)
+
+    assert check((1, 2))
+    assert check((1, 2))
+    assert not check((2, 1))
+    assert check({'a': (1, 2)})    # unhashable : not cached
+    assert check({'a': (1, 2)})
+    assert len(calls) == 4
+    assert check.cache_info() == types.CheckCacheInfo(1, 4, 2, 2)
+
+    check((3, 4))   # evicts (1, 2)
+    check((1, 2))
+    assert len(calls) == 6
+
+    check.cache_clear()
+    assert check.cache_info() == types.CheckCacheInfo(0, 0, 2, 0)
+
+    # equal values of other types are checked again
+    integers = types.cached(lambda t: all(type(v) is int for v in t))
+    assert integers((1, 2))
+    assert not integers((1.0, 2))
+    assert not integers(frozenset([1.0, 2]))
+    assert integers(frozenset([1, 2]))
+
+    nested = types.cached(lambda t: type(t[0][0]) is int)
+    assert nested(((1,), 2))
+    assert not nested(((1.0,), 2))
+
+def test_cached_predicate_by_identity():
+    large = {i: (-float(i), float(i)) for i in range(10000)}
+    check = types.cached(types.specifications, identity=True)
+
+    assert check(large)
+    assert check(dict(large))
+    assert check.cache_info().misses == 2
+
+    scope = {'check': check, 'large': large}
+    print("1000 cached checks: {}".format(
+        timeit("check(large)", number=1000, globals=scope)))
+    assert check.cache_info().hits == 1000
+
+    # a hit doesn't go through the entries
+    assert count_python_calls(check, large) < 5
+    assert check.cache_info().hits == 1001
+
 #####################################################################
 # NUMERIC PREDICATES
 #####################################################################
@@ -278,6 +654,46 @@ def test_finite_on_iterables():
     for x in ok:
         assert types.finite(x)
 
+def test_numeric_predicates_on_arrays():
+    x = smp.symbols('x')
+    large = np.random.rand(1000000)
+
+    assert types.numeric(large)
+    assert types.finite(large)
+    assert types.symbolic(large)
+    assert types.numeric(np.array([True, False]))
+    assert types.finite(np.arange(10, dtype=np.uint8))
+
+    large[-1] = np.nan
+    assert types.numeric(large)
+    assert not types.finite(large)
+
+    assert not types.numeric(np.array([1j, 2]))
+    assert types.finite(np.array([1j, 2]))
+    assert not types.symbolic(np.array([1j, 2]))
+
+    assert types.numeric(np.array([1.5, 3], dtype=object))
+    assert not types.numeric(np.array([1.5, None], dtype=object))
+    assert not types.finite(np.array([1.5, np.inf], dtype=object))
+    assert types.symbolic(np.array([1.5, x], dtype=object))
+    assert not types.symbolic(np.array(['a', 'b']))
+
+def test_numeric_predicates_performance_on_arrays():
+    large = np.random.rand(1000000)
+
+    scope = {'types': types, 'large': large}
+    for predicate in ('numeric', 'finite'):
+        print("10 {} checks on 1e6 floats: {}".format(
+            predicate,
+            timeit(
+                "types.{}(large)".format(predicate),
+                number=10,
+                globals=scope)))
+
+    # vectorized : the python calls don't grow with the size
+    assert count_python_calls(types.numeric, large) < 20
+    assert count_python_calls(types.finite, large) < 20
+
 #####################################################################
 # SYMBOLIC PREDICATES
 #####################################################################
@@ -363,6 +779,70 @@ def test_bounds_predicate_on_arrays():
     for x in arrays:
         assert types.bounds(x)
 
+def test_bounds_predicate_on_large_inputs():
+    lower = np.random.rand(500000)
+    large_array = np.stack([lower, lower + 1.0], axis=1)
+    large_dict = {str(i): (-float(i), float(i)) for i in range(1000)}
+
+    assert types.bounds(large_array)
+    assert types.bounds(large_dict)
+    assert types.bounds(np.zeros((0, 2)))
+    assert types.bounds(np.array([[1, 2], [3, 4]], dtype=object))
+
+    scope = {'types': types, 'large': large_array}
+    print("10 bounds checks on 500000 rows: {}".format(
+        timeit("types.bounds(large)", number=10, globals=scope)))
+
+    # vectorized : the python calls don't grow with the size
+    assert count_python_calls(types.bounds, large_array) < 20
+
+    large_array[1234, 1] = -1.0
+    large_dict['666'] = (1, 0)
+    assert not types.bounds(large_array)
+    assert not types.bounds(large_dict)
+    assert not types.bounds(np.array([[1, 2], [3, np.nan]]))
+
+    large_dict['666'] = ('a', 'b')  # not numeric : checked entry by entry
+    assert not types.bounds(large_dict)
+
+def test_bounds_errors_name_the_first_invalid_bound():
+    @types.typecheck
+    def optimize(limits: types.bounds):
+        pass
+
+    array = np.stack([np.zeros(100), np.ones(100)], axis=1)
+    array[42] = (1, 0)
+    array[57] = (1, 0)
+
+    with pytest.raises(TypeError, match='invalid bound at index 42'):
+        optimize(array)
+
+    with pytest.raises(TypeError, match="invalid bound at key 'b'"):
+        optimize({'a': (0, 1), 'b': (1, 0)})
+
+def count_python_calls(func, *args):
+    calls = [0]
+
+    def profiler(frame, event, arg):
+        if event == 'call':
+            calls[0] += 1
+
+    sys.setprofile(profiler)
+    try:
+        func(*args)
+    finally:
+        sys.setprofile(None)
+
+    return calls[0]
+
+def test_bounds_predicate_call_count():
+    large = {i: (-float(i), float(i)) for i in range(1000)}
+
+    # without the kernels : 22 calls per entry, through nested typechecks
+    calls = count_python_calls(types.bounds, large)
+    print("python calls to check 1000 bounds: {}".format(calls))
+    assert calls < 4 * len(large)
+
 #####################################################################
 # SPECIFICATIONS PREDICATES
 #####################################################################
@@ -428,6 +908,42 @@ def test_trace_data_predicate_on_dicts():
     for x in dicts:
         assert types.trace_data(x)
 
+def test_trace_data_predicate_on_arrays():
+    large = np.linspace(0.0, 1.0, 1000000)
+
+    assert types.trace_data({'x': large, 'y': large, 'name': 'large'})
+    assert not types.trace_data({'x': np.array([]), 'y': [], 'name': ''})
+
+    large[-1] = np.inf
+    assert not types.trace_data({'x': large, 'y': large, 'name': 'large'})
+
+def test_trace_container():
+    trace = types.Trace.from_dict(
+        {'x': range(1, 4), 'y': [0.5, 2, 8], 'name': 'random data'})
+
+    assert types.trace_data(trace)
+    assert len(trace) == 3
+    assert trace.x.dtype == np.float64
+    assert_allclose(trace.y, [0.5, 2.0, 8.0])
+    assert types.trace_data(trace.to_dict())
+
+    with pytest.raises(ValueError):
+        trace.x[0] = np.nan    # read-only
+
+    with pytest.raises(AttributeError):
+        trace.other = 4
+
+    bullshit = [
+        {'x': list(), 'y': range(1,4), 'name': 'bs'},
+        {'x': range(2), 'y': range(1,4), 'name': 'bs'},
+        {'x': range(3), 'y': 'abc', 'name': ''},
+        {'x': [1, np.nan, 3], 'y': range(3), 'name': ''},
+        {'x': np.ones((3, 2)), 'y': range(3), 'name': ''}]
+
+    for x in bullshit:
+        with pytest.raises(ValueError):
+            types.Trace.from_dict(x)
+
 #####################################################################
 # MATRIX & ARRAY PREDICATES
 #####################################################################
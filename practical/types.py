@@ -25,9 +25,15 @@ Examples
 
 from __future__ import division, print_function, absolute_import
 
-from decorator import decorator
+import collections
+import functools
 import inspect
+import json
+import math
 import numpy as np
+import os
+import time
+import warnings
 import sympy as smp
 
 #####################################################################
@@ -62,82 +68,899 @@ def function_arg_types_error(
           + ("accepts ({}), but ", "returns {}, but ")[flag].format(expected)\
           + ("was given", "result is")[flag] + " {}".format(actual)
 
+#####################################################################
+# TYPECHECK MODES
+#####################################################################
+
+TYPECHECK_MODES = ('on', 'off', 'sampled')
+
+TypecheckInfo = collections.namedtuple(
+    'TypecheckInfo',
+    ['mode', 'checked', 'skipped'])
+
+_DEFAULT_SAMPLING_RATE = 100
+
+# module name => (mode, rate, budget) ; the global setting is under ''
+_MODE_SETTINGS = {'': ('on', None, None)}
+
+def _parse_mode(text: str) -> tuple:
+    """
+    Parses a mode specification, like 'off', 'sampled:100' (1 in 100 calls)
+    or 'sampled:0.01' (1% of the running time spent checking).
+
+    Parameters
+    ----------
+    text: str.
+        The mode, optionally followed by the sampling parameter.
+
+    Returns
+    -------
+    out: tuple.
+        The mode, the sampling rate and the time budget.
+    """
+    __mode, __sep, __param = text.strip().lower().partition(':')
+    __rate, __budget = None, None
+
+    if __mode not in TYPECHECK_MODES:
+        raise ValueError("unknown typecheck mode '{}'".format(__mode))
+
+    if __param:
+        __value = float(__param)
+        if __value >= 1:
+            __rate = int(__value)
+        else:
+            __budget = __value
+
+    return __mode, __rate, __budget
+
+def _load_mode_settings(text: str) -> None:
+    """
+    Loads the modes from a comma separated list of specifications:
+    the entries named with a module apply to this module and its
+    submodules, the others are the global setting.
+
+        PRACTICAL_TYPECHECK="sampled:100,practical.arrays=off"
+
+    Parameters
+    ----------
+    text: str.
+        The value of the environment variable.
+    """
+    for __entry in filter(None, map(str.strip, text.split(','))):
+        __module, __sep, __spec = __entry.rpartition('=')
+        try:
+            _MODE_SETTINGS[__module.strip()] = _parse_mode(__spec)
+        except ValueError:
+            warnings.warn(
+                "ignoring invalid PRACTICAL_TYPECHECK entry '{}'".format(
+                    __entry))
+
+def set_typecheck_mode(
+        mode: str = 'on',
+        module: str = None,
+        rate: int = None,
+        budget: float = None) -> None:
+    """
+    Sets the typecheck mode, globally or for a module and its submodules.
+
+    The mode is read when a function is decorated: the functions that
+    are already decorated keep their mode. To change the mode of the
+    predicates in this module, use the PRACTICAL_TYPECHECK environment
+    variable, which is loaded at import time.
+
+    Parameters
+    ----------
+    mode: str.
+        - 'on': check every call.
+        - 'off': don't decorate at all ; the original function is used.
+        - 'sampled': check only a fraction of the calls.
+    module: str.
+        The name of the module ; None sets the global mode.
+    rate: int.
+        In sampled mode, checks one call in every rate.
+    budget: float.
+        In sampled mode, the maximum fraction of the running time spent
+        checking ; overrides the rate.
+    """
+    if mode not in TYPECHECK_MODES:
+        raise ValueError("unknown typecheck mode '{}'".format(mode))
+
+    _MODE_SETTINGS[module or ''] = (mode, rate, budget)
+
+def get_typecheck_mode(
+        module: str = None) -> tuple:
+    """
+    Returns the typecheck mode applied to the functions of a module.
+
+    Parameters
+    ----------
+    module: str.
+        The name of the module ; None returns the global mode.
+
+    Returns
+    -------
+    out: tuple.
+        The mode, the sampling rate and the time budget.
+    """
+    __module = module or ''
+    while __module not in _MODE_SETTINGS:
+        __module = __module.rpartition('.')[0]
+
+    return _MODE_SETTINGS[__module]
+
+_load_mode_settings(os.environ.get('PRACTICAL_TYPECHECK', ''))
+
+#####################################################################
+# INSTRUMENTATION
+#####################################################################
+
+# number of timings kept per function and phase, for the percentiles
+_INSTRUMENT_SAMPLES = 1024
+
+_INSTRUMENT_PHASES = ('arguments', 'body', 'returns')
+
+_INSTRUMENT_SETTINGS = {
+    'enabled': os.environ.get(
+        'PRACTICAL_TYPECHECK_INSTRUMENT', '').strip().lower()
+        in ('1', 'true', 'yes', 'on')}
+
+# qualified function name => _Instrument
+_INSTRUMENTS = {}
+
+class _Instrument(object):
+    """
+    Collects the timings of the calls to a typechecked function.
+
+    Parameters
+    ----------
+    name: str.
+        The qualified name of the function.
+    """
+    __slots__ = ('name', 'calls', 'failures', 'totals', 'samples')
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.failures = {'arguments': 0, 'returns': 0}
+        self.totals = dict.fromkeys(_INSTRUMENT_PHASES, 0.0)
+        self.samples = {
+            __phase: collections.deque(maxlen=_INSTRUMENT_SAMPLES)
+            for __phase in _INSTRUMENT_PHASES}
+
+    def record(self, phase, elapsed):
+        self.totals[phase] += elapsed
+        self.samples[phase].append(elapsed)
+
+    def snapshot(self):
+        __phases = {}
+        for __phase in _INSTRUMENT_PHASES:
+            __samples = np.array(self.samples[__phase])
+            __percentiles = (
+                np.percentile(__samples, (50, 90, 99))
+                if __samples.size else (0.0, 0.0, 0.0))
+            __phases[__phase] = {
+                'total': self.totals[__phase],
+                'p50': float(__percentiles[0]),
+                'p90': float(__percentiles[1]),
+                'p99': float(__percentiles[2])}
+
+        return {
+            'calls': self.calls,
+            'failures': dict(self.failures),
+            'time': __phases}
+
+def set_typecheck_instrumentation(
+        enabled: bool = True) -> None:
+    """
+    Enables the instrumentation of the functions decorated from now on.
+    It can also be enabled at import time, with the environment variable
+    PRACTICAL_TYPECHECK_INSTRUMENT=1.
+
+    Parameters
+    ----------
+    enabled: bool.
+        Whether to instrument the typechecked functions.
+    """
+    _INSTRUMENT_SETTINGS['enabled'] = bool(enabled)
+
+def typecheck_snapshot() -> dict:
+    """
+    Returns the statistics of all the instrumented functions.
+
+    The times are in seconds ; the percentiles are computed over the last
+    calls of each function.
+
+    Returns
+    -------
+    out: dict.
+        For each qualified function name :
+        {'calls': int,
+         'failures': {'arguments': int, 'returns': int},
+         'time': {phase: {'total', 'p50', 'p90', 'p99'}}}
+        with the phases 'arguments', 'body' and 'returns'.
+    """
+    return {
+        __name: __instrument.snapshot()
+        for __name, __instrument in sorted(_INSTRUMENTS.items())}
+
+def typecheck_report(
+        format: str = 'text') -> str:
+    """
+    Formats the statistics of the instrumented functions.
+
+    Parameters
+    ----------
+    format: str.
+        'text' for a table, sorted by checking time, or 'json'.
+
+    Returns
+    -------
+    out: str.
+        The report.
+    """
+    __snapshot = typecheck_snapshot()
+
+    if format == 'json':
+        return json.dumps(__snapshot, indent=2, sort_keys=True)
+    elif format != 'text':
+        raise ValueError("unknown report format '{}'".format(format))
+
+    def __checking_time(item):
+        __time = item[1]['time']
+        return __time['arguments']['total'] + __time['returns']['total']
+
+    __lines = ["{:<48} {:>9} {:>8} {:>12} {:>12} {:>12} {:>10}".format(
+        'function', 'calls', 'failed', 'args (ms)', 'body (ms)',
+        'return (ms)', 'p99 (us)')]
+
+    for __name, __stats in sorted(
+            __snapshot.items(),
+            key=__checking_time,
+            reverse=True):
+        __time = __stats['time']
+        __lines.append(
+            "{:<48} {:>9} {:>8} {:>12.3f} "
+            "{:>12.3f} {:>12.3f} {:>10.2f}".format(
+                __name,
+                __stats['calls'],
+                sum(__stats['failures'].values()),
+                1e3 * __time['arguments']['total'],
+                1e3 * __time['body']['total'],
+                1e3 * __time['returns']['total'],
+                1e6 * (__time['arguments']['p99'] + __time['returns']['p99'])))
+
+    return "\n".join(__lines)
+
+def reset_typecheck_instruments() -> None:
+    """
+    Clears the statistics of all the instrumented functions.
+    """
+    for __name in list(_INSTRUMENTS):
+        _INSTRUMENTS[__name] = _Instrument(__name)
+
+def _instrumented(
+        func,
+        check_arguments,
+        returns_checker,
+        returns_test,
+        precall):
+    """
+    Wraps a function with type checking, timing each phase of the calls.
+
+    Parameters
+    ----------
+    func: callable.
+        The original function.
+    check_arguments: callable.
+        Validates the arguments, as returned by _arguments_checker.
+    returns_checker: type or callable.
+        The return annotation.
+    returns_test: callable.
+        The compiled return annotation.
+    precall: bool.
+        Validate the arguments before the call.
+
+    Returns
+    -------
+    out: callable.
+        The decorated function.
+    """
+    __name = "{}.{}".format(
+        getattr(func, '__module__', None),
+        getattr(func, '__qualname__', func.__name__))
+    __instruments = _INSTRUMENTS
+    if __name not in __instruments:
+        __instruments[__name] = _Instrument(__name)
+
+    def __check(args, kwargs, instrument):
+        __start = time.perf_counter()
+        try:
+            if check_arguments is not None:
+                check_arguments(args, kwargs)
+        except TypeError:
+            instrument.failures['arguments'] += 1
+            raise
+        finally:
+            instrument.record('arguments', time.perf_counter() - __start)
+
+    @functools.wraps(func)
+    def __typechecked(*args, **kwargs):
+        __instrument = __instruments[__name]
+        __instrument.calls += 1
+
+        if precall:
+            __check(args, kwargs, __instrument)
+
+        __start = time.perf_counter()
+        __result = func(*args, **kwargs)
+        __instrument.record('body', time.perf_counter() - __start)
+
+        if not precall:
+            __check(args, kwargs, __instrument)
+
+        __start = time.perf_counter()
+        __valid = returns_test is None or returns_test(__result)
+        __instrument.record('returns', time.perf_counter() - __start)
+        if not __valid:
+            __instrument.failures['returns'] += 1
+            _raise_return_error(func, returns_checker, __result)
+
+        return __result
+
+    return __typechecked
+
 #####################################################################
 # TYPE ENFORCEMENT
 #####################################################################
 
-def _check(arg, checker):
+# public predicate => raw kernel, filled at the end of the module
+_KERNELS = {}
+
+# raw kernel => function describing why a value fails, for the error messages
+_DIAGNOSTICS = {}
+
+def _kernel(checker):
     """
-    Check a given argument against either a type or a predicate.
+    Returns the undecorated kernel of a public predicate, so that checking
+    an argument doesn't trigger a cascade of nested type checks.
 
     Parameters
     ----------
-    arg: anything.
-        The argument value.
     checker: type or callable.
-        A callable giving a boolean value for any value.
+        A type or predicate.
+
+    Returns
+    -------
+    out: type or callable.
+        The kernel of checker if any, checker itself otherwise.
+    """
+    try:
+        return _KERNELS.get(checker, checker)
+    except TypeError:   # unhashable
+        return checker
+
+def _checkable(checker) -> bool:
+    """
+    Checks whether an annotation can actually constrain a value.
+
+    Parameters
+    ----------
+    checker:
+        The annotation.
 
     Returns
     -------
     out: bool.
-        Whether the argument satisfies the input constraints.
+        True if the annotation is a type or a predicate.
     """
-    if type(checker) == type:
-        return isinstance(arg, checker)     #types
-    elif callable(checker):
-        return checker(arg)                 #predicates
+    return type(checker) == type or callable(checker)
+
+def _compile_checker(checker):
+    """
+    Turns a type or a predicate into a test function, deciding once and
+    for all how to apply it.
+
+    Parameters
+    ----------
+    checker: type or callable.
+        A type or predicate.
+
+    Returns
+    -------
+    out: callable.
+        A function of a single argument, truthy when the argument
+        satisfies the checker.
+    """
+    __kernel = _kernel(checker)
+
+    if type(__kernel) == type:
+        def __is_instance(x):
+            return isinstance(x, __kernel)
+        return __is_instance
+    elif callable(__kernel):
+        return __kernel
     else:
-        return True   
+        return _anything
+
+def _compile_checks(func):
+    """
+    Reads the annotations of a function once and for all, and lists the
+    checks to perform on each call.
+
+    Annotations that are neither types nor callables are dropped, since
+    they always pass.
+
+    Parameters
+    ----------
+    func: callable.
+        The function to inspect.
+
+    Returns
+    -------
+    out: dict.
+        The checks, sorted by kind of parameter:
+        - 'positional': tuple of (index, name, checker, test).
+        - 'keyword': tuple of (name, checker, test), for the keyword
+          only args.
+        - 'defaults': dict of the default values failing their check ;
+          the defaults are tested here, once, instead of on each call.
+        - 'varargs': (first index, checker, test) for the extra
+          positional args.
+        - 'varkw': (checker, test) for the extra keyword args.
+        - 'named': set of the named parameters, excluded from varkw.
+        - 'returns': (checker, test) for the return value.
+        The checker is the annotation, and test its compiled version.
+        The missing checks are set to None.
+    """
+    # the signature follows __wrapped__, through the other decorators
+    __signature = inspect.signature(func)
+    __parameters = list(__signature.parameters.values())
+
+    __annotations = {
+        __parameter.name: __parameter.annotation
+        for __parameter in __parameters
+        if __parameter.annotation is not inspect.Parameter.empty}
+    if __signature.return_annotation is not inspect.Signature.empty:
+        __annotations['return'] = __signature.return_annotation
+
+    __args = [
+        __parameter.name for __parameter in __parameters
+        if __parameter.kind in (
+            inspect.Parameter.POSITIONAL_ONLY,
+            inspect.Parameter.POSITIONAL_OR_KEYWORD)]
+    __kwonlyargs = [
+        __parameter.name for __parameter in __parameters
+        if __parameter.kind == inspect.Parameter.KEYWORD_ONLY]
+    __varargs_name = next((
+        __parameter.name for __parameter in __parameters
+        if __parameter.kind == inspect.Parameter.VAR_POSITIONAL), None)
+    __varkw_name = next((
+        __parameter.name for __parameter in __parameters
+        if __parameter.kind == inspect.Parameter.VAR_KEYWORD), None)
+
+    __tests = {
+        __name: _compile_checker(__annotation)
+        for __name, __annotation in __annotations.items()
+        if _checkable(__annotation)}
+
+    __positional = tuple(
+        (__i, __argname, __annotations[__argname], __tests[__argname])
+        for __i, __argname in enumerate(__args)
+        if __argname in __tests)
+
+    __keyword = tuple(
+        (__argname, __annotations[__argname], __tests[__argname])
+        for __argname in __kwonlyargs
+        if __argname in __tests)
+
+    __defaults = {}
+    for __parameter in __parameters:
+        __test = __tests.get(__parameter.name, None)
+        if __test is None \
+                or __parameter.default is inspect.Parameter.empty \
+                or __parameter.kind in (
+                    inspect.Parameter.VAR_POSITIONAL,
+                    inspect.Parameter.VAR_KEYWORD):
+            continue
+        try:
+            __valid = __test(__parameter.default)
+        except Exception:
+            __valid = False     # raises again on the calls
+        if not __valid:
+            __defaults[__parameter.name] = __parameter.default
+
+    __varargs = None
+    if __varargs_name in __tests:
+        __varargs = (
+            len(__args),
+            __annotations[__varargs_name],
+            __tests[__varargs_name])
+
+    __varkw = None
+    if __varkw_name in __tests:
+        __varkw = (
+            __annotations[__varkw_name],
+            __tests[__varkw_name])
+
+    __returns = None
+    if 'return' in __tests:
+        __returns = (__annotations['return'], __tests['return'])
+
+    return {
+        'positional': __positional or None,
+        'keyword': __keyword or None,
+        'defaults': __defaults,
+        'varargs': __varargs,
+        'varkw': __varkw,
+        'named': frozenset(__args + __kwonlyargs),
+        'returns': __returns}
+
+def _raise_arg_error(func, argname, checker, arg):
+    """
+    Raises the TypeError for an invalid argument.
+
+    Parameters
+    ----------
+    func: callable.
+        The function that failed.
+    argname: str.
+        The name of the parameter.
+    checker: type or callable.
+        The annotation of the parameter.
+    arg:
+        The invalid value.
+    """
+    __message = function_arg_types_error(
+        func.__name__,
+        "{}:{}".format(argname, checker),
+        "{}={}".format(argname, repr(type(arg))),
+        0)
+
+    __diagnostic = _DIAGNOSTICS.get(_kernel(checker), None)
+    if __diagnostic is not None:
+        __detail = __diagnostic(arg)
+        if __detail:
+            __message += " ; {}".format(__detail)
+
+    raise TypeError(__message)
+
+def _raise_return_error(func, checker, result):
+    """
+    Raises the TypeError for an invalid return value.
+
+    Parameters
+    ----------
+    func: callable.
+        The function that failed.
+    checker: type or callable.
+        The return annotation.
+    result:
+        The invalid value.
+    """
+    raise TypeError(function_arg_types_error(
+        func.__name__,
+        "{}".format(checker),
+        repr(type(result)),
+        1))
 
-@decorator
-def typecheck(func, *args, **kwargs):
+def _arguments_checker(func, plan):
+    """
+    Builds the function validating the arguments of a call, from the
+    checks compiled for func.
+
+    Parameters
+    ----------
+    func: callable.
+        The decorated function.
+    plan: dict.
+        The checks, as returned by _compile_checks.
+
+    Returns
+    -------
+    out: callable.
+        Takes the args tuple and kwargs dict of a call ; raises TypeError
+        when any of them is invalid. None if there's nothing to check.
+    """
+    __positional = plan['positional']
+    __keyword = plan['keyword']
+    __defaults = plan['defaults']
+    __varargs = plan['varargs']
+    __varkw = plan['varkw']
+    __named = plan['named']
+
+    if not (__positional or __keyword or __varargs or __varkw):
+        return None
+
+    def __check_arguments(args, kwargs):
+        if __positional:
+            __count = len(args)
+            for __i, __argname, __checker, __test in __positional:
+                if __i < __count:
+                    __arg = args[__i]
+                elif __argname in kwargs:
+                    __arg = kwargs[__argname]
+                elif __argname in __defaults:
+                    __arg = __defaults[__argname]
+                else:
+                    continue
+                if not __test(__arg):
+                    _raise_arg_error(func, __argname, __checker, __arg)
+
+        if __keyword:
+            for __argname, __checker, __test in __keyword:
+                if __argname in kwargs:
+                    __arg = kwargs[__argname]
+                elif __argname in __defaults:
+                    __arg = __defaults[__argname]
+                else:
+                    continue
+                if not __test(__arg):
+                    _raise_arg_error(func, __argname, __checker, __arg)
+
+        if __varargs:
+            __start, __checker, __test = __varargs
+            for __arg in args[__start:]:
+                if not __test(__arg):
+                    _raise_arg_error(func, '*', __checker, __arg)
+
+        if __varkw:
+            __checker, __test = __varkw
+            for __argname, __arg in kwargs.items():
+                if __argname not in __named and not __test(__arg):
+                    _raise_arg_error(func, __argname, __checker, __arg)
+
+    return __check_arguments
+
+def _timed_checks(check_arguments, returns_test, timings):
+    """
+    Wraps the checks of a function, to add up the time spent checking ;
+    the time spent in the function itself is left out.
+
+    Parameters
+    ----------
+    check_arguments: callable.
+        Validates the arguments, as returned by _arguments_checker ; or
+        None.
+    returns_test: callable.
+        The compiled return annotation ; or None.
+    timings: list.
+        The time spent checking is added to its first item.
+
+    Returns
+    -------
+    out: tuple.
+        The timed versions of check_arguments and returns_test.
+    """
+    __timed_arguments = None
+    if check_arguments is not None:
+        def __timed_arguments(args, kwargs):
+            __start = time.perf_counter()
+            try:
+                check_arguments(args, kwargs)
+            finally:
+                timings[0] += time.perf_counter() - __start
+
+    __timed_returns = None
+    if returns_test is not None:
+        def __timed_returns(result):
+            __start = time.perf_counter()
+            try:
+                return returns_test(result)
+            finally:
+                timings[0] += time.perf_counter() - __start
+
+    return __timed_arguments, __timed_returns
+
+def _sampled(func, checked_call, rate, budget, timings=None):
+    """
+    Wraps a function so that only a fraction of the calls are checked.
+
+    Parameters
+    ----------
+    func: callable.
+        The original function.
+    checked_call: callable.
+        The function, with the type checking.
+    rate: int.
+        Checks one call in every rate.
+    budget: float.
+        The maximum fraction of the running time spent checking ; when
+        given, the rate is ignored.
+    timings: list.
+        In budget mode, the [time spent checking, total time] ; the
+        checks of checked_call add up their own time, see _timed_checks.
+
+    Returns
+    -------
+    out: callable.
+        The decorated function, with a typecheck_info method returning
+        the number of checked and skipped calls.
+    """
+    __counts = [0, 0]   # checked, skipped
+
+    if budget:
+        __timings = timings
+
+        @functools.wraps(func)
+        def __typechecked(*args, **kwargs):
+            __start = time.perf_counter()
+            if __timings[0] <= budget * __timings[1]:
+                __counts[0] += 1
+                try:
+                    return checked_call(*args, **kwargs)
+                finally:
+                    __timings[1] += time.perf_counter() - __start
+            else:
+                __counts[1] += 1
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    __timings[1] += time.perf_counter() - __start
+    else:
+        __rate = max(1, int(rate or _DEFAULT_SAMPLING_RATE))
+
+        @functools.wraps(func)
+        def __typechecked(*args, **kwargs):
+            if (__counts[0] + __counts[1]) % __rate:
+                __counts[1] += 1
+                return func(*args, **kwargs)
+            else:
+                __counts[0] += 1
+                return checked_call(*args, **kwargs)
+
+    def typecheck_info():
+        return TypecheckInfo('sampled', __counts[0], __counts[1])
+
+    __typechecked.typecheck_info = typecheck_info
+
+    return __typechecked
+
+def typecheck(
+        func=None,
+        *,
+        precall=False,
+        mode=None,
+        rate=None,
+        budget=None,
+        instrument=None):
     """
     Function decorator. Checks decorated function is given valid arguments,
     following the information written in the annotations.
 
-    ! NOTE !
-    Only checking the varargs ; there's no information to chck the kwargs.
+    The annotations are read once, when the function is decorated: each
+    call only runs the checkers.
+
+    All the annotated parameters are checked, whether they are given
+    by position, keyword or default value ; the default values are
+    tested once, when decorating. The annotations of *args and **kwargs
+    apply to each of the extra values.
+
+    Can be used bare, or with options:
+        >>> @typecheck(precall=True)
+        ... def solve(equation: symbolic) -> symbolic:
+        ...     pass
+
+    The mode is resolved when decorating, from the options, then the
+    setting of the module of func and finally the global setting ; see
+    set_typecheck_mode and the PRACTICAL_TYPECHECK environment variable.
 
     Parameters
     ----------
     func: callable.
         A function on which we want to enforce type checking.
+    precall: bool.
+        Validate the arguments before running the function, instead of
+        after. The return value is always checked after the call.
+        Invalid calls to expensive functions fail right away.
+    mode: str.
+        'on', 'off' or 'sampled' ; overrides the module & global settings.
+    rate: int.
+        In sampled mode, checks one call in every rate.
+    budget: float.
+        In sampled mode, the maximum fraction of the running time spent
+        checking.
+    instrument: bool.
+        Time the argument checks, the body and the return check of each
+        call ; see typecheck_snapshot and typecheck_report. Defaults to
+        the global setting, see set_typecheck_instrumentation.
 
     Returns
     -------
     out: callable.
-        The decorated function.
+        The decorated function ; func itself in 'off' mode.
     """
-    __result = func(*args, **kwargs)
+    if func is None:
+        return functools.partial(
+            typecheck,
+            precall=precall,
+            mode=mode,
+            rate=rate,
+            budget=budget,
+            instrument=instrument)
+
+    if mode is None:
+        mode, __rate, __budget = get_typecheck_mode(
+            getattr(func, '__module__', None))
+        rate = __rate if rate is None else rate
+        budget = __budget if budget is None else budget
+    elif mode not in TYPECHECK_MODES:
+        raise ValueError("unknown typecheck mode '{}'".format(mode))
+
+    if mode == 'off':
+        return func
+
+    __plan = _compile_checks(func)
+    __check_arguments = _arguments_checker(func, __plan)
+    __returns = __plan['returns']
+
+    if __check_arguments is None and __returns is None:
+        return func
+
+    __returns_checker, __returns_test = __returns or (None, None)
+
+    __timings = None
+    if mode == 'sampled' and budget:
+        __timings = [0.0, 0.0]  # time spent checking, total time
+        __check_arguments, __returns_test = _timed_checks(
+            __check_arguments,
+            __returns_test,
+            __timings)
+
+    if instrument is None:
+        instrument = _INSTRUMENT_SETTINGS['enabled']
+
+    if instrument:
+        __typechecked = _instrumented(
+            func,
+            __check_arguments,
+            __returns_checker,
+            __returns_test,
+            precall)
+    elif precall:
+        @functools.wraps(func)
+        def __typechecked(*args, **kwargs):
+            if __check_arguments is not None:
+                __check_arguments(args, kwargs)
+
+            __result = func(*args, **kwargs)
+
+            if __returns_test is not None and not __returns_test(__result):
+                _raise_return_error(func, __returns_checker, __result)
+
+            return __result
+    else:
+        @functools.wraps(func)
+        def __typechecked(*args, **kwargs):
+            __result = func(*args, **kwargs)
+
+            if __check_arguments is not None:
+                __check_arguments(args, kwargs)
 
-    if hasattr(func, '__annotations__') and func.__annotations__:
-        __arg_spec = inspect.getfullargspec(func)
+            if __returns_test is not None and not __returns_test(__result):
+                _raise_return_error(func, __returns_checker, __result)
 
-        for __argname, __arg in zip(__arg_spec.args, args):
-            if __argname in func.__annotations__:
-                __checker = func.__annotations__[__argname]
-                if not _check(__arg, __checker):
-                    raise TypeError(function_arg_types_error(
-                        func.__name__,
-                        "{}:{}".format(__argname, __checker),
-                        "{}={}".format(__argname, repr(type(__arg))),
-                        0))
+            return __result
 
-        if 'return' in func.__annotations__:
-            __checker = func.__annotations__['return']
-            if not _check(__result, __checker):
-                raise TypeError(function_arg_types_error(
-                    func.__name__,
-                    "{}".format(__checker),
-                    repr(type(__result)),
-                    1))
+    if mode == 'sampled':
+        return _sampled(func, __typechecked, rate, budget, __timings)
 
-    return __result
+    return __typechecked
 
 #####################################################################
 # GENERIC PREDICATES
 #####################################################################
 
+# The predicates are split in two layers :
+# - the raw kernels, prefixed with an underscore, do the actual checking
+#   without any type enforcement ; they are used internally.
+# - the public predicates are typechecked and delegate to the kernels.
+# When compiling the checks, the public predicates found in annotations
+# are replaced with their kernels, see _kernel.
+
+def _anything(x):
+    """Kernel of anything."""
+    return True
+
 @typecheck
 def anything(x) -> bool:
     """
@@ -153,7 +976,11 @@ def anything(x) -> bool:
     out: bool.
         Always True.
     """
-    return True
+    return _anything(x)
+
+def _nothing(x):
+    """Kernel of nothing."""
+    return x is None
 
 @typecheck
 def nothing(x) -> bool:
@@ -170,7 +997,7 @@ def nothing(x) -> bool:
     out: bool.
         True if x is None.
     """
-    return x is None
+    return _nothing(x)
 
 @typecheck
 def exactly(y) -> callable:
@@ -196,50 +1023,164 @@ def exactly(y) -> callable:
 
     return _exactly
 
+# number of evaluations between two reorderings of the adaptive combinators
+_ADAPTIVE_PERIOD = 256
+
+# the adaptive combinators time one evaluation in every _ADAPTIVE_SAMPLING
+_ADAPTIVE_SAMPLING = 16
+
+def _adaptive(tests, stop):
+    """
+    Builds a short-circuiting combinator, which reorders its tests by
+    their observed efficiency : the rate at which they end the evaluation,
+    over their mean cost.
+
+    Parameters
+    ----------
+    tests: tuple.
+        The compiled checkers.
+    stop: bool.
+        The outcome ending the evaluation : True for one_of, False
+        for all_of.
+
+    Returns
+    -------
+    out: callable.
+        The combined predicate.
+    """
+    __order = [tuple(range(len(tests)))]
+    __stats = [[0, 0, 0, 0.0] for __test in tests]  # runs, stops, timed, time
+    __count = [0]
+
+    def __efficiency(i):
+        __runs, __stops, __timed, __time = __stats[i]
+        __rate = (__stops + 1) / (__runs + 1)
+        __cost = (__time + 1e-9) / (__timed + 1)
+        return __rate / __cost
+
+    def __adaptive(x):
+        __count[0] += 1
+        if not __count[0] % _ADAPTIVE_PERIOD:
+            __order[0] = tuple(sorted(
+                __order[0],
+                key=__efficiency,
+                reverse=True))
+
+        __timing = not __count[0] % _ADAPTIVE_SAMPLING
+        for __i in __order[0]:
+            __stat = __stats[__i]
+            __stat[0] += 1
+            if __timing:
+                __start = time.perf_counter()
+                __outcome = bool(tests[__i](x))
+                __stat[2] += 1
+                __stat[3] += time.perf_counter() - __start
+            else:
+                __outcome = bool(tests[__i](x))
+            if __outcome is stop:
+                __stat[1] += 1
+                return stop
+
+        return not stop
+
+    return __adaptive
+
 @typecheck
-def one_of(*checkers) -> callable:
+def one_of(*checkers, adaptive: bool = False) -> callable:
     """
     Checks whether an input satisfies at least one of the given checkers.
 
+    The checkers are compiled once ; the evaluation stops at the first
+    satisfied checker. The types are all tested at once, before the
+    predicates.
+
     Parameters
     ----------
     checkers: list.
         List of checker callables.
+    adaptive: bool.
+        Reorder the checkers by observed hit rate and cost, so that the
+        most likely and cheapest are evaluated first. Only for pure
+        predicates, without side effects.
 
     Returns
     -------
     out: bool.
         True of any of the checkers is satisfied.
     """
-    def __one_of(x):
-        return any([
-            _check(x, __checker)
-            for __checker in checkers])
+    __types = tuple(
+        __c for __c in map(_kernel, checkers)
+        if type(__c) == type)
+    __tests = tuple(
+        _compile_checker(__c) for __c in checkers
+        if type(_kernel(__c)) != type)
+
+    if __types:
+        def __is_instance(x):
+            return isinstance(x, __types)
+
+        __tests = (__is_instance,) + __tests
+
+    if adaptive and len(__tests) > 1:
+        return _adaptive(__tests, True)
+    elif len(__tests) == 1:
+        __test = __tests[0]
+
+        def __one_of(x):
+            return bool(__test(x))
+    else:
+        def __one_of(x):
+            for __test in __tests:
+                if __test(x):
+                    return True
+            return False
 
     return __one_of
 
 @typecheck
-def all_of(*checkers) -> callable:
+def all_of(*checkers, adaptive: bool = False) -> callable:
     """
     Checks whether an input satisfies all the given checkers.
 
+    The checkers are compiled once ; the evaluation stops at the first
+    failed checker.
+
     Parameters
     ----------
     checkers: list.
         List of checker callables.
+    adaptive: bool.
+        Reorder the checkers by observed failure rate and cost, so that
+        the most likely to fail and cheapest are evaluated first. Only
+        for pure predicates, without side effects.
 
     Returns
     -------
     out: bool.
         True of all of the checkers are satisfied.
     """
-    def __all_of(x):
-        return all([
-            _check(x, __checker)
-            for __checker in checkers])
+    __tests = tuple(map(_compile_checker, checkers))
+
+    if adaptive and len(__tests) > 1:
+        return _adaptive(__tests, False)
+    else:
+        def __all_of(x):
+            for __test in __tests:
+                if not __test(x):
+                    return False
+            return True
 
     return __all_of
 
+def _iterable(x):
+    """Kernel of iterable."""
+    try:
+        it = iter(x)
+    except TypeError:
+        return False
+    else:
+        return True
+
 @typecheck
 def iterable(x) -> bool:
     """
@@ -255,19 +1196,124 @@ def iterable(x) -> bool:
     out: bool.
         True if the argument is iterable.
     """
-    try:
-        it = iter(x)
-    except TypeError:
-        return False
-    else:
-        return True
+    return _iterable(x)
 
 #####################################################################
-# NUMERIC PREDICATES
+# RESULT CACHING
 #####################################################################
 
+CheckCacheInfo = collections.namedtuple(
+    'CheckCacheInfo',
+    ['hits', 'misses', 'maxsize', 'currsize'])
+
+def _typed_key(x):
+    """
+    Builds a hash key with the type of the value, and of the items of the
+    tuples and frozensets : (1, 2) and (1.0, 2) are equal, yet a checker
+    may accept one and reject the other.
+
+    Parameters
+    ----------
+    x:
+        The checked value.
+
+    Returns
+    -------
+    out: tuple.
+        The key ; unhashable when x is.
+    """
+    if isinstance(x, tuple):
+        return (type(x), tuple(map(_typed_key, x)))
+    if isinstance(x, frozenset):
+        return (type(x), frozenset(map(_typed_key, x)))
+    return (type(x), x)
+
 @typecheck
-def _numeric_scalar(x) -> bool:
+def cached(
+        checker,
+        maxsize: int = 128,
+        identity: bool = False) -> callable:
+    """
+    Caches the results of a checker, so that validating the same immutable
+    object again costs a single lookup.
+
+    The least recently used results are evicted past maxsize entries.
+
+    ! NOTE !
+    Only for immutable values : mutating a cached object would not
+    invalidate its result.
+
+    Parameters
+    ----------
+    checker: type or callable.
+        The type or predicate to cache.
+    maxsize: int.
+        The maximum number of results kept.
+    identity: bool.
+        Key the results by object identity instead of value : the lookup is
+        O(1) even for large tuples, and unhashable objects like dicts can be
+        cached. The cached objects are kept alive until they are evicted.
+        Otherwise the values are keyed by hash, with the types of their
+        items, and the unhashable ones are checked without caching.
+
+    Returns
+    -------
+    out: callable.
+        The caching predicate, with cache_info and cache_clear methods.
+    """
+    __test = _compile_checker(checker)
+    __cache = collections.OrderedDict()
+    __stats = [0, 0]    # hits, misses
+
+    def __cached(x):
+        try:
+            __key = id(x) if identity else _typed_key(x)
+            __entry = __cache.get(__key, None)
+        except TypeError:   # unhashable
+            __stats[1] += 1
+            return bool(__test(x))
+
+        if __entry is not None and (not identity or __entry[0] is x):
+            __stats[0] += 1
+            try:
+                __cache.move_to_end(__key)
+            except KeyError:    # evicted in the meantime
+                pass
+            return __entry[1]
+
+        __stats[1] += 1
+        __result = bool(__test(x))
+        __cache[__key] = (x, __result)
+        while len(__cache) > maxsize:
+            __cache.popitem(last=False)
+
+        return __result
+
+    def cache_info():
+        return CheckCacheInfo(__stats[0], __stats[1], maxsize, len(__cache))
+
+    def cache_clear():
+        __cache.clear()
+        __stats[:] = [0, 0]
+
+    __cached.cache_info = cache_info
+    __cached.cache_clear = cache_clear
+
+    return __cached
+
+#####################################################################
+# NUMERIC PREDICATES
+#####################################################################
+
+# the array dtypes whose elements are all numeric : bool, int, float
+_NUMERIC_KINDS = 'biuf'
+
+# the most common scalar types, checked without any conversion
+_NUMERIC_TYPES = frozenset([
+    bool, int, float,
+    np.bool_, np.int32, np.int64, np.float32, np.float64])
+
+def _numeric_scalar(x):
     """
     Checks a scalar object value against all the numeric types at once :
     int, float, np.float64...
@@ -290,6 +1336,29 @@ def _numeric_scalar(x) -> bool:
     else:
         return True
 
+def _numeric(x):
+    """Kernel of numeric."""
+    if type(x) in _NUMERIC_TYPES:
+        return True
+    elif isinstance(x, dict):
+        return bool(all(map(
+            _numeric_scalar,
+            x.values())))
+    elif isinstance(x, np.ndarray):
+        if x.dtype.kind in _NUMERIC_KINDS:
+            return True
+        elif x.dtype.kind == 'c':
+            return x.size == 0  # complex numbers can't be cast to float
+        return bool(all(map(
+            _numeric_scalar,
+            x.flat)))
+    elif _iterable(x):
+        return bool(all(map(
+            _numeric_scalar,
+            x)))
+    else:
+        return _numeric_scalar(x)
+
 @typecheck
 def numeric(x) -> bool:
     """
@@ -298,6 +1367,8 @@ def numeric(x) -> bool:
 
     ! NOTE !
     Can be used on array like objects and iterables.
+    Arrays are checked on their dtype ; only the object arrays are
+    checked element by element.
 
     Parameters
     ----------
@@ -308,23 +1379,9 @@ def numeric(x) -> bool:
     -------
     out: bool.
     """
-    if isinstance(x, dict):
-        return bool(all(map(
-            _numeric_scalar,
-            x.values())))
-    elif isinstance(x, np.ndarray):
-        return bool(all(map(
-            _numeric_scalar,
-            x.flat)))
-    elif iterable(x):
-        return bool(all(map(
-            _numeric_scalar,
-            x)))
-    else:
-        return _numeric_scalar(x)
+    return _numeric(x)
 
-@typecheck
-def _finite_scalar(x) -> bool:
+def _finite_scalar(x):
     """
     Checks whether a scalar input is a finite numeric value.
 
@@ -338,6 +1395,9 @@ def _finite_scalar(x) -> bool:
     out: bool.
         True when the argument is finite.
     """
+    if type(x) in _NUMERIC_TYPES:
+        return math.isfinite(x)
+
     try:
         bool(np.all(np.isfinite(x)))
     except TypeError:
@@ -345,6 +1405,25 @@ def _finite_scalar(x) -> bool:
     else:
         return bool(np.all(np.isfinite(x)))
 
+def _finite(x):
+    """Kernel of finite."""
+    if isinstance(x, dict):
+        return bool(all(map(
+            _finite_scalar,
+            x.values())))
+    elif isinstance(x, np.ndarray):
+        if x.dtype.kind in _NUMERIC_KINDS or x.dtype.kind == 'c':
+            return bool(np.isfinite(x).all())
+        return bool(all(map(
+            _finite_scalar,
+            x.flat)))
+    elif _iterable(x):
+        return bool(all(map(
+            _finite_scalar,
+            x)))
+    else:
+        return _finite_scalar(x)
+
 @typecheck
 def finite(x) -> bool:
     """
@@ -352,6 +1431,7 @@ def finite(x) -> bool:
 
     ! NOTE !
     Can be used on array like objects and iterables.
+    Numeric arrays are checked in a single vectorized pass.
 
     Parameters
     ----------
@@ -363,27 +1443,13 @@ def finite(x) -> bool:
     out: bool.
         True when the argument is finite.
     """
-    if isinstance(x, dict):
-        return bool(all(map(
-            _finite_scalar,
-            x.values())))
-    elif isinstance(x, np.ndarray):
-        return bool(all(map(
-            _finite_scalar,
-            x.flat)))
-    elif iterable(x):
-        return bool(all(map(
-            _finite_scalar,
-            x)))
-    else:
-        return _finite_scalar(x)
+    return _finite(x)
 
 #####################################################################
 # SYMBOLIC PREDICATES
 #####################################################################
 
-@typecheck
-def _symbolic_scalar(x) -> bool:
+def _symbolic_scalar(x):
     """
     Checks whether the input is a symbolic expression ; any class
     derived from sympy core qualify.
@@ -398,7 +1464,26 @@ def _symbolic_scalar(x) -> bool:
     out: bool.
         True if the argument is a symbolic expression.
     """
-    return numeric(x) or isinstance(x, smp.Expr)
+    return _numeric(x) or isinstance(x, smp.Expr)
+
+def _symbolic(x):
+    """Kernel of symbolic."""
+    if isinstance(x, dict):
+        return bool(all(map(
+            _symbolic_scalar,
+            x.values())))
+    elif isinstance(x, np.ndarray):
+        if x.dtype != object:
+            return _numeric(x)  # only object arrays can hold expressions
+        return bool(all(map(
+            _symbolic_scalar,
+            x.flat)))
+    elif _iterable(x):
+        return bool(all(map(
+            _symbolic_scalar,
+            x)))
+    else:
+        return _symbolic_scalar(x)
 
 @typecheck
 def symbolic(x) -> bool:
@@ -419,27 +1504,16 @@ def symbolic(x) -> bool:
     out: bool.
         True if the argument is a symbolic expression.
     """
-    if isinstance(x, dict):
-        return bool(all(map(
-            _symbolic_scalar,
-            x.values())))
-    elif isinstance(x, np.ndarray):
-        return bool(all(map(
-            _symbolic_scalar,
-            x.flat)))
-    elif iterable(x):
-        return bool(all(map(
-            _symbolic_scalar,
-            x)))
-    else:
-        return _symbolic_scalar(x)
+    return _symbolic(x)
 
 #####################################################################
 # BOUNDS PREDICATES
 #####################################################################
 
-@typecheck
-def _check_bounds_tuple(x) -> bool:
+# dicts with at least this many bounds are checked in bulk, as an array
+_BULK_BOUNDS_SIZE = 64
+
+def _check_bounds_tuple(x):
     """
     Checks whether a tuple is a valid bound.
 
@@ -457,17 +1531,50 @@ def _check_bounds_tuple(x) -> bool:
         bool(x) and
         isinstance(x, tuple) and
         len(x) == 2 and
-        numeric(x[0]) and
-        numeric(x[1]) and
+        _numeric(x[0]) and
+        _numeric(x[1]) and
         bool(x[0] <= x[1])) # cast from np.bool_ !!
 
     return is_valid
 
-@typecheck
-def _check_bounds_dict(x) -> bool:
+def _bounds_dict_as_array(x):
+    """
+    Converts the values of a dict of bounds into a single (N, 2) numeric
+    array, when they are all pairs of numbers.
+
+    Parameters
+    ----------
+    x: dict.
+        The bounds.
+
+    Returns
+    -------
+    out: np.ndarray.
+        The (N, 2) array of bounds ; None when the values can't be
+        converted as a whole.
+    """
+    __values = list(x.values())
+
+    if set(map(type, __values)) != {tuple}:
+        return None
+
+    try:
+        __array = np.array(__values)
+    except (TypeError, ValueError):     # ragged
+        return None
+
+    if __array.ndim == 2 and __array.shape[1] == 2 \
+            and __array.dtype.kind in _NUMERIC_KINDS:
+        return __array
+    else:
+        return None
+
+def _check_bounds_dict(x):
     """
     Checks whether a dict represents valid bounds.
 
+    Large dicts of numeric pairs are checked in bulk, as an array.
+
     Parameters
     ----------
     x: dict.
@@ -478,20 +1585,25 @@ def _check_bounds_dict(x) -> bool:
     out: bool.
         True if the argument is valid bounds.
     """
-    is_valid = (
-        bool(x)
-        and isinstance(x, dict)
-        and all(map(
-            lambda t: _check_bounds_tuple(x=t),
-            x.values())))
-    
-    return is_valid
+    if not (x and isinstance(x, dict)):
+        return False
 
-@typecheck
-def _check_bounds_array(x) -> bool:
+    if len(x) >= _BULK_BOUNDS_SIZE:
+        __array = _bounds_dict_as_array(x)
+        if __array is not None:
+            return _check_bounds_array(__array)
+
+    return all(map(
+        _check_bounds_tuple,
+        x.values()))
+
+def _check_bounds_array(x):
     """
     Checks whether a np.ndarray represents valid bounds.
 
+    Numeric arrays are checked in a single vectorized pass ; only the
+    object arrays are checked line by line.
+
     Parameters
     ----------
     x: np.ndarray.
@@ -502,31 +1614,54 @@ def _check_bounds_array(x) -> bool:
     out: bool.
         True if the argument is valid bounds.
     """
-    is_valid = (
-        isinstance(x, np.ndarray)
-        and len(x.shape) == 2
-        and x.shape[1] == 2
-        and all(map(
-            lambda t: _check_bounds_tuple(x=t),
-            [tuple(line) for line in x])))
+    if not (
+            isinstance(x, np.ndarray)
+            and len(x.shape) == 2
+            and x.shape[1] == 2):
+        return False
 
-    return is_valid
+    if x.dtype.kind in _NUMERIC_KINDS:
+        with np.errstate(invalid='ignore'):
+            return bool((x[:, 0] <= x[:, 1]).all())
 
-@typecheck
-def bounds(x) -> bool:
+    return all(map(
+        _check_bounds_tuple,
+        [tuple(line) for line in x]))
+
+def _bounds_diagnostic(x):
     """
-    Checks whether an argument represents valid bounds.
+    Describes the first invalid bound of an argument, for the error
+    messages ; only called on failure.
 
     Parameters
     ----------
     x:
-        The argument to check.
+        The argument that failed the bounds predicate.
 
     Returns
     -------
-    out: bool.
-        True if the argument is valid bounds.
+    out: str.
+        The position of the first invalid bound, or an empty string.
     """
+    if isinstance(x, dict):
+        for __key, __bound in x.items():
+            if not _check_bounds_tuple(__bound):
+                return "invalid bound at key {}".format(repr(__key))
+    elif isinstance(x, np.ndarray) and len(x.shape) == 2 and x.shape[1] == 2:
+        if x.dtype.kind in _NUMERIC_KINDS:
+            with np.errstate(invalid='ignore'):
+                __invalid = np.flatnonzero(~(x[:, 0] <= x[:, 1]))
+        else:
+            __invalid = [
+                __i for __i, __line in enumerate(x)
+                if not _check_bounds_tuple(tuple(__line))]
+        if len(__invalid):
+            return "invalid bound at index {}".format(__invalid[0])
+
+    return ''
+
+def _bounds(x):
+    """Kernel of bounds."""
     if isinstance(x, tuple):
         return _check_bounds_tuple(x)
     elif isinstance(x, dict):
@@ -536,10 +1671,35 @@ def bounds(x) -> bool:
     else:
         return False
 
+@typecheck
+def bounds(x) -> bool:
+    """
+    Checks whether an argument represents valid bounds.
+
+    Parameters
+    ----------
+    x:
+        The argument to check.
+
+    Returns
+    -------
+    out: bool.
+        True if the argument is valid bounds.
+    """
+    return _bounds(x)
+
 #####################################################################
 # SPECIFICATIONS PREDICATES
 #####################################################################
 
+def _specifications(x):
+    """Kernel of specifications."""
+    return (
+        isinstance(x, dict)
+        and _bounds(x)
+        and all([_finite(v[0]) for k, v in x.items()])
+        and all([_finite(v[1]) for k, v in x.items()]))
+
 @typecheck
 def specifications(x) -> bool:
     """
@@ -555,46 +1715,196 @@ def specifications(x) -> bool:
     out: bool.
         True if the argument is valid specifications.
     """
-    return (
-        isinstance(x, dict)
-        and bounds(x)
-        and all([finite(v[0]) for k, v in x.items()])
-        and all([finite(v[1]) for k, v in x.items()]))
+    return _specifications(x)
 
 #####################################################################
 # TRACE & CHARTS PREDICATES
 #####################################################################
 
-@typecheck
-def trace_data(x) -> bool:
+def _numeric_series(x):
     """
-    Checks whether an argument contains graphing data.
+    Converts a series of values into a 1-D numeric array, without
+    coercing strings or other objects.
 
     Parameters
     ----------
     x:
-        The argument to check.
+        The series.
+
+    Returns
+    -------
+    out: np.ndarray.
+        The series as an array ; None when it is not purely numeric.
+    """
+    if isinstance(x, np.ndarray):
+        __array = x
+    else:
+        try:
+            __array = np.asarray(x)
+        except (TypeError, ValueError):     # ragged
+            return None
+
+    if __array.ndim == 1 and __array.dtype.kind in _NUMERIC_KINDS:
+        return __array
+    else:
+        return None
+
+def _finite_series(x):
+    """
+    Checks whether a series is made of finite values, in a single
+    vectorized pass when it is purely numeric.
+
+    Parameters
+    ----------
+    x:
+        The series.
 
     Returns
     -------
     out: bool.
-        True if the argument is valid data for a trace.
+        True when all the values of the series are finite.
+    """
+    __array = _numeric_series(x)
+
+    if __array is not None:
+        return bool(np.isfinite(__array).all())
+    else:
+        return all(map(_finite, x))
+
+class Trace(object):
     """
+    Compact graphing data : the x and y series as float64 arrays,
+    and the name of the trace.
+
+    The data is validated once, on creation ; the series are read-only,
+    so that trace_data accepts a Trace without checking it again.
+
+    Parameters
+    ----------
+    x: iterable.
+        The abscissas, finite numeric values.
+    y: iterable.
+        The ordinates, finite numeric values, as many as x.
+    name: str.
+        The name of the trace.
+    """
+    __slots__ = ('_x', '_y', '_name')
+
+    def __init__(self, x, y, name=''):
+        __x = _numeric_series(x)
+        __y = _numeric_series(y)
+
+        if __x is None or __y is None:
+            raise ValueError("the trace data must be 1-D numeric series")
+
+        __x = np.array(__x, dtype=np.float64)
+        __y = np.array(__y, dtype=np.float64)
+
+        if not __x.size or __x.size != __y.size:
+            raise ValueError(
+                "the trace series must be non empty and of equal sizes, "
+                "got {} and {}".format(__x.size, __y.size))
+
+        if not (np.isfinite(__x).all() and np.isfinite(__y).all()):
+            raise ValueError("the trace data must be finite")
+
+        __x.flags.writeable = False
+        __y.flags.writeable = False
+
+        self._x = __x
+        self._y = __y
+        self._name = name
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """
+        Creates a trace from its dict form {'x': ..., 'y': ..., 'name': ...}.
+
+        Parameters
+        ----------
+        data: dict.
+            The graphing data.
+
+        Returns
+        -------
+        out: Trace.
+            The validated trace.
+        """
+        return cls(
+            x=data.get('x', ()),
+            y=data.get('y', ()),
+            name=data.get('name', ''))
+
+    def to_dict(self) -> dict:
+        """
+        Returns the dict form of the trace.
+
+        Returns
+        -------
+        out: dict.
+            {'x': ..., 'y': ..., 'name': ...}, with the array series.
+        """
+        return {'x': self._x, 'y': self._y, 'name': self._name}
+
+    @property
+    def x(self):
+        return self._x
+
+    @property
+    def y(self):
+        return self._y
+
+    @property
+    def name(self):
+        return self._name
+
+    def __len__(self):
+        return self._x.size
+
+    def __repr__(self):
+        return "Trace(name={}, size={})".format(repr(self._name), len(self))
+
+def _trace_data(x):
+    """Kernel of trace_data."""
+    if isinstance(x, Trace):
+        return True     # validated on creation
+
     return (
         isinstance(x, dict)
         and (
             'x' in x.keys()
-            and iterable(x.get('x'))
-            and bool(x.get('x'))
-            and all(map(finite, x.get('x'))))
+            and _iterable(x.get('x'))
+            and len(x.get('x')) > 0
+            and _finite_series(x.get('x')))
         and (
             'y' in x.keys()
-            and iterable(x.get('y'))
-            and bool(x.get('y'))
-            and all(map(finite, x.get('y'))))
+            and _iterable(x.get('y'))
+            and len(x.get('y')) > 0
+            and _finite_series(x.get('y')))
         and len(x.get('x')) == len(x.get('y'))
         and 'name' in x.keys())
 
+@typecheck
+def trace_data(x) -> bool:
+    """
+    Checks whether an argument contains graphing data.
+
+    ! NOTE !
+    Trace objects are accepted in O(1) ; the dict series are checked
+    in a single vectorized pass when they are numeric.
+
+    Parameters
+    ----------
+    x:
+        The argument to check.
+
+    Returns
+    -------
+    out: bool.
+        True if the argument is valid data for a trace.
+    """
+    return _trace_data(x)
+
 #####################################################################
 # MATRIX & ARRAY PREDICATES
 #####################################################################
@@ -602,8 +1912,7 @@ def trace_data(x) -> bool:
 # TODO distinguish the scalar schecking from the numeric checking
 # and array can be numeric, but it won't be scalar
 # and a scalar can be numeric or not but it won't be array like
-@typecheck
-def _iterable_scalar(x) -> bool:
+def _iterable_scalar(x):
     """
     Checks whether an iterable argument is of dimension 1.
 
@@ -619,9 +1928,16 @@ def _iterable_scalar(x) -> bool:
     """
     if isinstance(x, np.ndarray):
         return x.size == 1
-    elif iterable(x):
+    elif _iterable(x):
         return len(x) == 1
 
+def _scalar(x):
+    """Kernel of scalar."""
+    if _iterable(x):
+        return _iterable_scalar(x)
+    else:
+        return True
+
 @typecheck
 def scalar(x) -> bool:
     """
@@ -641,7 +1957,23 @@ def scalar(x) -> bool:
     out: bool.
         True if the argument is valid data for a trace.
     """
-    if iterable(x):
-        return _iterable_scalar(x)
-    else:
-        return True
\ No newline at end of file
+    return _scalar(x)
+
+#####################################################################
+# KERNELS
+#####################################################################
+
+_KERNELS.update({
+    anything: _anything,
+    nothing: _nothing,
+    iterable: _iterable,
+    numeric: _numeric,
+    finite: _finite,
+    symbolic: _symbolic,
+    bounds: _bounds,
+    specifications: _specifications,
+    trace_data: _trace_data,
+    scalar: _scalar})
+
+_DIAGNOSTICS.update({
+    _bounds: _bounds_diagnostic})